@@ -1,36 +1,54 @@
 # refer to cache.py for:
 # - get_venue_ratings
 # - get_top_venues
-# - clean_venue_details
 
 # refer to swarm.py for everything related to venues, venues details, etc.
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from src.swarm import worker, cache
-from threading import Thread
+from threading import BoundedSemaphore, Thread
 from flask_cors import CORS
-from src.cache import Categories, PriceTier
-from llm.main import chatbot, HumanMessage
+from src.cache import Categories, PriceTier, ROLE
+from src.tool_cache import ToolCache, compact_venue
+from src.router import FastPathRouter
+from src.answer_cache import AnswerCache, normalize_query, location_bucket
+from src.map_payload import MapPayload
+from src.payload import EncodedPayload
+from src.historical import HistoricalPlaces
+from src.single_flight import SingleFlight
+from src.metrics import registry
+from llm.main import chatbot, HumanMessage, AIMessage
+from llm.streaming import stream_chat, sse
+from llm.sessions import SessionStore
 from typing import Literal
 from rich import print
 import json
+import os
+from itertools import chain
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Session-Id", "X-Total-Count"])
 app.config['CORS_HEADERS'] = 'Content-Type'
 
-system_message = '''You are an assistant specifically designed to help tourists in Riyadh, Saudi Arabia. The user is based in riyadh in these coordinates: lat: 24.698889, lng: 46.685151
+system_message = '''You are an assistant specifically designed to help tourists in Riyadh, Saudi Arabia. The user is based in riyadh; their coordinates are given in the next system message.
 When a user asks for recommendations, use the tools 'get_top_venues' to find the top venues in the area and respond with: 'The top venues in Riyadh are: [list of venues].' 
 If a user asks for information about a specific venue, use the tool 'get_venue_by_id' to retrieve details such as ratings and hours of operation, and present them concisely: 'The venue [venue name] has a rating of [rating] and is open [hours].' 
+For descriptive requests (e.g. "quiet cafe with wifi", "best kabsa"), use 'search_venues'.
+For historical places near the user or a location, use 'get_historical_places'; for venues around a historical place (e.g. "cafes near Al Masmak"), use 'get_venues_near_place'.
 Most importantly, after you give any venue to the user, display the idx number of the venue inside curly brackets. E.g. "The top venues in Riyadh are: 1. Venue1 {idx: 1}"
 Always provide friendly, concise, and accurate information tailored to the tourist's needs.
 '''
 
+historical = HistoricalPlaces()
+tool_cache = ToolCache(lambda: (cache.version, historical.version))
+
+@tool_cache
 def get_venue_ratings(venue_id: str) -> list[dict]:
     """ Get the ratings of a venue """
     return cache.get_venue_ratings(venue_id)
 
-def get_top_venues(n: int=5, latitude: float = None, longitude: float = None, category: Literal["all", "cafe", "restaurant", "lounge", "event", "hotel", "shopping"] = "all", price_tier: Literal["all", "Cheap", "Moderate", "Expensive", "Very Expensive"] = "all") -> list[dict]:
+@tool_cache
+def get_top_venues(n: int=5, latitude: float = None, longitude: float = None, category: Literal["all", "cafe", "restaurant", "lounge", "event", "hotel", "shopping"] = "all", price_tier: Literal["all", "Cheap", "Moderate", "Expensive", "Very Expensive"] = "all", radius_km: float = None, ranking: Literal["score", "distance", "weighted"] = "score") -> list[dict]:
     """ Get the top venues in the area based on the user's location, category, and price tier
     
     Args:
@@ -39,21 +57,148 @@ def get_top_venues(n: int=5, latitude: float = None, longitude: float = None, ca
         longitude: longitude coordinate, default is user's location
         category: one of ["all", "cafe", "restaurant", "lounge", "event", "hotel", "shopping"], default is all
         price_tier: one of ["all", "Cheap", "Moderate", "Expensive", "Very Expensive"], default is all
+        radius_km: only consider venues within this distance of the location, default is 10km
+        ranking: one of ["score", "distance", "weighted"]; "score" ranks by popularity, "distance" returns the nearest venues, "weighted" favours popular venues that are close. default is score
     """
     location = (float(latitude), float(longitude)) if latitude is not None and longitude is not None else None
     category = Categories(category)
     price_tier = PriceTier(price_tier)
-    return cache.get_top_venues(n, location, category, price_tier)
+    return [compact_venue(v) for v in cache.get_top_venues(n, location, category, price_tier, radius_km, ranking)]
 
+@tool_cache
 def get_venue_by_id(venue_id: str) -> dict:
     """ Get the details of a venue by its id """
-    return cache.get_venue_by_id(venue_id)
+    return compact_venue(cache.get_venue_by_id(venue_id), detail=True)
+
+@tool_cache
+def search_venues(query: str, n: int = 5, category: Literal["all", "cafe", "restaurant", "lounge", "event", "hotel", "shopping"] = "all", price_tier: Literal["all", "Cheap", "Moderate", "Expensive", "Very Expensive"] = "all", latitude: float = None, longitude: float = None, radius_km: float = None) -> list[dict]:
+    """ Search venues by what people say about them (names, tips, phrases and lists), e.g. "quiet cafe with wifi" or "best kabsa"
+    
+    Args:
+        query: what to look for, in English or Arabic
+        n: number of venues to return, default is 5
+        category: one of ["all", "cafe", "restaurant", "lounge", "event", "hotel", "shopping"], default is all
+        price_tier: one of ["all", "Cheap", "Moderate", "Expensive", "Very Expensive"], default is all
+        latitude: only return venues near this latitude, default is anywhere
+        longitude: only return venues near this longitude, default is anywhere
+        radius_km: distance from the location to search within, default is 10km
+    """
+    if n < 1:
+        raise ValueError("n must be at least 1")
+    location = (float(latitude), float(longitude)) if latitude is not None and longitude is not None else None
+    venues = cache.search_venues(query, n, location, Categories(category), PriceTier(price_tier), radius_km)
+    return [{**compact_venue(v), "matches": v["matches"]} for v in venues]
 
+@tool_cache
+def get_historical_places(latitude: float = None, longitude: float = None, radius_km: float = 10, n: int = 5) -> list[dict]:
+    """ Get the historical places nearest to a location
+    
+    Args:
+        latitude: latitude coordinate, default is user's location
+        longitude: longitude coordinate, default is user's location
+        radius_km: only consider places within this distance of the location, default is 10km
+        n: number of places to return, default is 5
+    """
+    location = (float(latitude), float(longitude)) if latitude is not None and longitude is not None else USER_LOCATION
+    return [{k: v for k, v in place.items() if k != "img"} for place in historical.near(location, radius_km, n)]
+
+@tool_cache
+def get_venues_near_place(place: str, n: int = 5, category: Literal["all", "cafe", "restaurant", "lounge", "event", "hotel", "shopping"] = "all", radius_km: float = 2, ranking: Literal["score", "distance", "weighted"] = "weighted") -> dict:
+    """ Get the top venues around a historical place, e.g. "Al Masmak"
+    
+    Args:
+        place: name of the historical place
+        n: number of venues to return, default is 5
+        category: one of ["all", "cafe", "restaurant", "lounge", "event", "hotel", "shopping"], default is all
+        radius_km: only consider venues within this distance of the place, default is 2km
+        ranking: one of ["score", "distance", "weighted"], default is weighted
+    """
+    found = historical.find(place)
+    if found is None:
+        return {"error": f"Unknown historical place: {place}"}
+    location = tuple(found['coordinates'])
+    venues = cache.get_top_venues(n, location, Categories(category), PriceTier.ALL, radius_km, ranking)
+    return {"place": found['place'], "venues": [compact_venue(v) for v in venues]}
+
+USER_LOCATION = (24.698889, 46.685151)
+router = FastPathRouter(cache, USER_LOCATION)
+answer_cache = AnswerCache()
+llm_flight = SingleFlight("chat")
+map_payload = MapPayload(cache)
+
+sessions = SessionStore()
+# under a sync WSGI server each open LLM stream holds a worker thread until the answer is
+# complete (the graph itself runs on the shared event loop), so only this many run at once
+stream_slots = BoundedSemaphore(int(os.environ.get("RAYA_MAX_STREAMS", "32")))
+
+registry.register_cache("tool_calls", lambda: (tool_cache.hits, tool_cache.misses, len(tool_cache.entries)))
+registry.register_cache("answers", lambda: (answer_cache.hits, answer_cache.misses, len(answer_cache)))
+registry.register_cache("fast_path", lambda: (router.hits, router.misses, 0))
 graph = chatbot(
     system_message,
-    [get_venue_ratings, get_top_venues, get_venue_by_id]
+    [get_venue_ratings, get_top_venues, get_venue_by_id, search_venues, get_historical_places, get_venues_near_place],
+    checkpointer=sessions.checkpointer
 )
-config = {"configurable": {"thread_id": "1"}}
+
+def session_id_of(data: dict) -> str:
+    return data.get('session_id') or request.headers.get('X-Session-Id') or sessions.new_id()
+
+def location_of(data: dict) -> tuple[float, float]:
+    """ The request's latitude/longitude, or the default user location; ValueError if they aren't coordinates """
+    if data.get('latitude') is None or data.get('longitude') is None:
+        return USER_LOCATION
+    try:
+        latitude, longitude = float(data['latitude']), float(data['longitude'])
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must be numbers")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("latitude must be within [-90, 90] and longitude within [-180, 180]")
+    return latitude, longitude
+
+def chat_config(session_id: str, location: tuple[float, float]) -> dict:
+    """ Graph config for the session's thread, telling the assistant where the user is """
+    config = sessions.config(session_id)
+    config["configurable"]["location"] = location
+    return config
+
+def last_answer(config: dict) -> str:
+    """ The session's previous assistant message, which scopes cached answers to the conversation """
+    messages = graph.get_state(config).values.get("messages", [])
+    return next((m.content for m in reversed(messages) if m.type == "ai" and isinstance(m.content, str)), "")
+
+def cached_response(payload: EncodedPayload) -> Response:
+    """ Serve a precomputed payload in the best accepted encoding, or 304 if the client has it """
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "no-cache", **payload.headers}
+    if any(request.if_none_match.contains_weak(etag) for etag in payload.etags()):
+        return Response(status=304, headers=headers)
+
+    encoding, body, etag = payload.negotiate(request.accept_encodings)
+    response = Response(body, mimetype="application/json", headers=headers)
+    response.set_etag(etag)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+def fast_answer(message: str, config: dict, location: tuple[float, float], context: str) -> str|None:
+    """ Answer from the fast-path router or the answer cache if possible, recording the turn in the session """
+    answer = router.route(message, location) or answer_cache.get(message, cache.version, location, context)
+    if answer:
+        graph.update_state(config, {"messages": [HumanMessage(content=message), AIMessage(content=answer)]}, as_node="assistant")
+    return answer
+
+def llm_answer(message: str, config: dict, location: tuple[float, float], context: str, version: int) -> str:
+    """ Answer with the LLM; identical questions asked concurrently in the same scope share one call, recorded in each session """
+    def invoke():
+        response = graph.invoke({"messages": [HumanMessage(content=message)]}, config)
+        answer = response["messages"][-1].content
+        answer_cache.put(message, answer, version, location, context)
+        return answer
+
+    key = (normalize_query(message), version, location_bucket(location), context)
+    answer, collapsed = llm_flight.do(key, invoke)
+    if collapsed:
+        graph.update_state(config, {"messages": [HumanMessage(content=message), AIMessage(content=answer)]}, as_node="assistant")
+    return answer
 
 @app.route("/")
 def index():
@@ -61,46 +206,179 @@ def index():
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    message = request.get_json().get('message')
+    data = request.get_json()
+    message = data.get('message')
     if not message:
         return jsonify({"error": "No message provided"}), 400
 
     try:
-        response = graph.invoke({
-            "messages": [HumanMessage(content=message)]
-        }, config)
-        
-        assistant_message = response["messages"][-1].content
+        location = location_of(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    session_id = session_id_of(data)
+    config = chat_config(session_id, location)
+    context, version = last_answer(config), cache.version
+    try:
+        assistant_message = fast_answer(message, config, location, context)
+        if assistant_message is None:
+            assistant_message = llm_answer(message, config, location, context, version)
         
         return jsonify({
-            "message": assistant_message
+            "message": assistant_message,
+            "session_id": session_id
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Same as /api/chat, but streams tokens and tool events as server-sent events.
+    The first event, `session`, carries the session_id to continue the conversation with.
+    Each LLM stream holds a server thread while it is open, so at most RAYA_MAX_STREAMS
+    (default 32) run at once; past that the request gets a 503 and should retry or use /api/chat.
+    """
+    data = request.get_json()
+    message = data.get('message')
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+
+    try:
+        location = location_of(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    session_id = session_id_of(data)
+    config = chat_config(session_id, location)
+    context, version = last_answer(config), cache.version
+    try:
+        answer = fast_answer(message, config, location, context)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if answer is not None:
+        events = iter([sse("token", {"content": answer}), sse("done", {"message": answer})])
+    elif not stream_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many open chat streams, try again shortly"}), 503, {"Retry-After": "1"}
+    else:
+        on_done = lambda answer: answer_cache.put(message, answer, version, location, context)
+        events = stream_chat(graph, {"messages": [HumanMessage(content=message)]}, config, on_done)
+    events = chain([sse("session", {"session_id": session_id})], events)
+    response = Response(events, mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id})
+    if answer is None:
+        # released once the response is closed, whether or not it was streamed to the end
+        response.call_on_close(stream_slots.release)
+    return response
+
 @app.route('/api/trending-venues')
 def trending_venues():
-    # return all venues in cache
-    return jsonify(list(cache.venues.values()))
+    """
+    Map view of every cached venue, most popular first. Optional query parameters:
+    bbox=south,west,north,east, zoom (thins out venues below street level),
+    page and page_size. The total number of matches is in X-Total-Count.
+    """
+    try:
+        bbox = request.args.get('bbox')
+        if bbox is not None:
+            bbox = tuple(float(x) for x in bbox.split(','))
+            if len(bbox) != 4:
+                raise ValueError("bbox needs south,west,north,east")
+        zoom = request.args.get('zoom', type=int)
+        page = request.args.get('page', type=int)
+        page_size = request.args.get('page_size', type=int)
+        if (page is not None and page < 1) or (page_size is not None and page_size < 1):
+            raise ValueError("page and page_size start at 1")
+        if zoom is not None and zoom < 0:
+            raise ValueError("zoom starts at 0")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return cached_response(map_payload.query(bbox, zoom, page, page_size))
+
+@app.route('/api/search')
+def search():
+    """ Full-text venue search, same parameters as the search_venues tool (q for the query) """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    try:
+        return jsonify(search_venues(
+            query,
+            request.args.get('n', default=5, type=int),
+            request.args.get('category', default="all"),
+            request.args.get('price_tier', default="all"),
+            request.args.get('latitude', type=float),
+            request.args.get('longitude', type=float),
+            request.args.get('radius_km', type=float)
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 @app.route('/api/historical-places')
 def historical_places():
-    with open('.cache/historical_places.json', 'r') as outf:
-        data = json.loads(outf.read())
-    
-    return jsonify(data)
+    """
+    Every historical place, or with latitude/longitude (and optionally radius_km
+    and n) only the ones nearby, nearest first
+    """
+    latitude, longitude = request.args.get('latitude', type=float), request.args.get('longitude', type=float)
+    if latitude is None or longitude is None:
+        return cached_response(historical.response())
+    radius_km = request.args.get('radius_km', default=10, type=float)
+    return jsonify(historical.near((latitude, longitude), radius_km, request.args.get('n', type=int)))
+
+@app.route('/api/historical-places/<place>/venues')
+def historical_place_venues(place: str):
+    """ Top venues around a historical place, same query parameters as the get_venues_near_place tool """
+    try:
+        result = get_venues_near_place(
+            place,
+            request.args.get('n', default=5, type=int),
+            request.args.get('category', default="all"),
+            request.args.get('radius_km', default=2, type=float),
+            request.args.get('ranking', default="weighted")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if "error" in result:
+        return jsonify(result), 404
+    return jsonify(result)
+
+@app.route('/metrics')
+def metrics():
+    """ Prometheus metrics """
+    if not registry.enabled:
+        return "metrics are disabled (RAYA_METRICS=0)\n", 404
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/api/venue/<venue_idx>')
 def venue(venue_idx: int):
-    venue = get_venue_by_id(venue_idx)
+    venue = cache.get_venue_by_id(venue_idx)
     if venue:
         return jsonify(venue)
     return jsonify({"error": "Venue not found"}), 404
 
 
+crawling = False
+
+def create_app() -> Flask:
+    """
+    App factory for WSGI servers, e.g. `gunicorn -w 4 'app:create_app()'`.
+
+    In the default standalone role the crawler runs in a thread of this process,
+    so serve with a single worker. To serve with several, run the crawler alone
+    with RAYA_ROLE=writer (`python -m src.swarm`) and the workers with
+    RAYA_ROLE=reader: they map the venue snapshots it publishes instead of each
+    loading and crawling the venues.
+    """
+    global crawling
+    if ROLE == "standalone" and not crawling:
+        crawling = True
+        Thread(target=worker, daemon=True).start()
+    return app
+
+
 if __name__ == "__main__":
-    Thread(target=worker, daemon=True).start()
-    app.run(host="0.0.0.0", port=5000)
+    create_app().run(host="0.0.0.0", port=5000)
 
     # test invoke the chatbot
     # graph = chatbot(system_message, [get_venue_ratings, get_top_venues, get_venue_by_id])
@@ -0,0 +1,65 @@
+"""
+Microbenchmark of the compiled category classifier against the keyword scans
+it replaced. Run from the repo root:
+
+    python -m benchmarks.bench_places_filter
+"""
+import json
+import timeit
+from src.enums import Categories
+from src.places_filter import ALLOWED_CATEGORIES, CATEGORY_KEYWORDS, classifier, classify_category, is_allowed_category
+
+
+def legacy_is_allowed_category(category: str) -> bool:
+    parital_filter_keywords = ["plaza", "mall", "cafe", "café", "coffee", "tea", "restaurant", "pub", "bar", "club", "lounge", "tea"]
+    partial_filter = any(keyword in category.lower() for keyword in parital_filter_keywords)
+    return category in ALLOWED_CATEGORIES or partial_filter
+
+
+def legacy_classify_category(category: str) -> Categories:
+    category = category.lower()
+    for enum, keywords in CATEGORY_KEYWORDS.items():
+        if any(keyword in category for keyword in keywords):
+            return enum
+    return Categories.ALL
+
+
+def category_names() -> list[str]:
+    with open('.cache/venues_details.json', 'r', encoding='utf-8') as f:
+        venues = json.load(f)
+    return [c['name'] for v in venues.values() for c in v.get('categories', [])]
+
+
+def main(repeat: int = 200):
+    names = category_names()
+    for name in set(names):
+        assert classify_category(name) == legacy_classify_category(name), name
+        assert is_allowed_category(name) == legacy_is_allowed_category(name), name
+
+    def run(fn):
+        return lambda: [fn(n) for n in names]
+
+    def cold(fn):
+        def bench():
+            classifier._allowed_memo.clear()
+            classifier._category_memo.clear()
+            [fn(n) for n in names]
+        return bench
+
+    results = {}
+    for label, fn in [
+        ("classify_category (legacy)", run(legacy_classify_category)),
+        ("classify_category (compiled, cold memo)", cold(classify_category)),
+        ("classify_category (compiled)", run(classify_category)),
+        ("is_allowed_category (legacy)", run(legacy_is_allowed_category)),
+        ("is_allowed_category (compiled, cold memo)", cold(is_allowed_category)),
+        ("is_allowed_category (compiled)", run(is_allowed_category)),
+    ]:
+        seconds = min(timeit.repeat(fn, number=repeat, repeat=5)) / repeat
+        results[label] = seconds / len(names) * 1e9
+        print(f"{label:<45} {results[label]:8.1f} ns/call")
+    return results
+
+
+if __name__ == "__main__":
+    main()
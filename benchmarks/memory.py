@@ -0,0 +1,83 @@
+"""
+Memory benchmark: resident bytes per venue of the venue store.
+
+For a synthetic dataset, each variant runs in its own process (inside a scratch
+directory holding the synthetic `.cache`) and reports the memory tracemalloc
+sees allocated once it is loaded:
+- raw: the raw Foursquare venues alone, as json.load returns them
+- records: one `VenueRecord` per venue
+- cache[resident]: a GEOCache with its venue index, raw venues in memory
+- cache[cold]: a GEOCache with its venue index, raw venues in SQLite
+
+Run from the repo root:
+
+    python -m benchmarks.memory --venues 10000
+    python -m benchmarks.memory --venues 100000 --light
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from benchmarks.synthetic import generate_venues, write_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VARIANTS = ["raw", "records", "cache[resident]", "cache[cold]"]
+
+
+def load(variant: str):
+    if variant.startswith("cache"):
+        from src.cache import GEOCache
+        cache = GEOCache(raw_store="cold" if variant == "cache[cold]" else "resident")
+        cache.index
+        return cache
+
+    with open('.cache/venues_details.json', 'r', encoding='utf-8') as f:
+        venues = json.load(f)
+    if variant == "records":
+        from src.records import VenueRecord
+        return {venue_id: VenueRecord.from_raw(venue_id, venue) for venue_id, venue in venues.items()}
+    return venues
+
+
+def run_child(variant: str):
+    # modules first, so only the data is measured
+    import src.cache, src.records, src.venue_index  # noqa: F401
+    tracemalloc.start()
+    data = load(variant)  # noqa: F841, kept alive while measuring
+    current, peak = tracemalloc.get_traced_memory()
+    print(json.dumps({"current": current, "peak": peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident bytes per venue of the venue store")
+    parser.add_argument("--venues", type=int, default=10_000)
+    parser.add_argument("--light", action="store_true", help="small synthetic venues")
+    parser.add_argument("--only", nargs="+", choices=VARIANTS)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    env = {
+        **os.environ,
+        # an empty reader as the module-level cache, so only the variant's own store is built
+        "RAYA_METRICS": "0", "RAYA_ROLE": "reader", "RAYA_SNAPSHOT": "missing.snapshot",
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+    }
+    with tempfile.TemporaryDirectory(prefix="raya-memory-") as scratch:
+        write_cache(generate_venues(args.venues, light=args.light), scratch)
+        print(f"{args.venues} venues")
+        for variant in args.only or VARIANTS:
+            result = subprocess.run([sys.executable, "-m", "benchmarks.memory", "--child", variant],
+                                    cwd=scratch, env=env, check=True, capture_output=True, text=True)
+            memory = json.loads(result.stdout.splitlines()[-1])
+            print(f"  {variant:<16} {memory['current'] / args.venues:10.0f} bytes/venue   peak {memory['peak'] / 2**20:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Benchmark suite for the hot paths: cache load/save, category filtering, the
+venue index queries and the Flask endpoints, on synthetic datasets.
+
+Each dataset size runs in its own process, inside a scratch directory holding
+a synthetic `.cache`, so the module-level cache loads the synthetic venues.
+Every scenario reports best and median time per call and the peak memory it
+allocates (tracemalloc). Results are written as JSON, to be compared across
+commits. Run from the repo root:
+
+    python -m benchmarks.run --sizes 1000 10000 --out bench.json
+    python -m benchmarks.run --sizes 100000 1000000 --light --out bench-large.json
+    python -m benchmarks.run --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from benchmarks.synthetic import generate_venues, write_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(fn, repeat: int = 5, budget: float = 10.0) -> dict:
+    """
+    Time `fn` (best and median of `repeat` runs of an auto-ranged number of
+    calls, fewer runs if that would take longer than `budget` seconds), then
+    trace one more call for its peak allocation
+    """
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    repeat = max(1, min(repeat, int(budget / elapsed)))
+    times = [t / number for t in timer.repeat(repeat, number)]
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "best_us": min(times) * 1e6,
+        "median_us": statistics.median(times) * 1e6,
+        "number": number,
+        "repeat": repeat,
+        "peak_alloc_kib": peak / 1024,
+    }
+
+
+def scenarios(seed: int = 0) -> dict:
+    """
+    name -> zero-argument callable, run against the cache in the current directory
+    """
+    import app as server
+    from src.cache import Cache, cache
+    from src.enums import Categories, PriceTier
+    from src.places_filter import classify_category, filter_venues
+    from src.records import VenueRecord
+    from src.venue_index import VenueIndex
+
+    rng = random.Random(seed)
+    snapshot = cache.snapshot
+    sample = rng.sample(list(snapshot.venues.values()), min(1000, len(snapshot.venues)))
+    raw_sample = [(record.id, cache.raw(record.id)) for record in sample]
+    names = [name for record in sample for name in record.categories]
+    idxs = [record.idx for record in sample]
+    here = (24.698889, 46.685151)
+
+    journal = Cache("bench_venues.json")
+    dict.update(journal, cache.venues.all_items())
+    keys = list(snapshot.venues)
+    snapshotted = Cache("bench_snapshot.json")
+    dict.update(snapshotted, journal)
+    snapshotted.backend.compact_every = 0
+
+    def save(target: Cache, dirty: int):
+        def run():
+            for key in rng.sample(keys, min(dirty, len(keys))):
+                target.touch(key)
+            target.save_to_filesystem()
+        return run
+
+    client = server.app.test_client()
+    cache.index  # built once up front, index.build is measured on its own
+    etag = client.get('/api/trending-venues', headers={"Accept-Encoding": "gzip"}).headers['ETag']
+
+    return {
+        "cache.load_from_filesystem": lambda: Cache("venues_details.json").load_from_filesystem(),
+        "cache.save_to_filesystem[100 dirty]": save(journal, 100),
+        "cache.save_to_filesystem[snapshot]": save(snapshotted, 1),
+        "index.build": lambda: VenueIndex().build(snapshot.venues),
+        "VenueRecord.from_raw[1000 venues]": lambda: [VenueRecord.from_raw(venue_id, venue) for venue_id, venue in raw_sample],
+        "filter_venues[1000 venues]": lambda: filter_venues([venue for _, venue in raw_sample]),
+        "classify_category[per 1000 venues]": lambda: [classify_category(n) for n in names],
+        "get_top_venues": lambda: cache.get_top_venues(5),
+        "get_top_venues[cafe, cheap]": lambda: cache.get_top_venues(5, None, Categories.CAFE, PriceTier.CHEAP),
+        "get_top_venues[near, score]": lambda: cache.get_top_venues(5, here),
+        "get_top_venues[near, weighted]": lambda: cache.get_top_venues(5, here, ranking="weighted"),
+        "get_top_venues[near, distance]": lambda: cache.get_top_venues(5, here, ranking="distance"),
+        "get_venue_by_id": lambda: cache.get_venue_by_id(rng.choice(idxs)),
+        "GET /api/trending-venues[gzip]": lambda: client.get('/api/trending-venues', headers={"Accept-Encoding": "gzip"}),
+        "GET /api/trending-venues[304]": lambda: client.get('/api/trending-venues', headers={"Accept-Encoding": "gzip", "If-None-Match": etag}),
+        "GET /api/trending-venues[bbox, zoom 12]": lambda: client.get('/api/trending-venues?bbox=24.6,46.6,24.8,46.8&zoom=12'),
+        "GET /api/venue/<idx>": lambda: client.get(f'/api/venue/{rng.choice(idxs)}'),
+        "GET /api/historical-places": lambda: client.get('/api/historical-places'),
+    }
+
+
+def run_child(out: str, only: list[str] = None):
+    started = time.perf_counter()
+    cases = scenarios()
+    results = {
+        "setup_s": time.perf_counter() - started,
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "scenarios": {},
+    }
+    for name, fn in cases.items():
+        if only and not any(o in name for o in only):
+            continue
+        results["scenarios"][name] = measure(fn)
+        print(f"  {name:<45} {results['scenarios'][name]['median_us']:12.1f} us", flush=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def git_commit() -> str|None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: list[int], light: bool = False, only: list[str] = None) -> dict:
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "light": light,
+        "sizes": {},
+    }
+    for size in sizes:
+        print(f"{size} venues")
+        with tempfile.TemporaryDirectory(prefix="raya-bench-") as scratch:
+            started = time.perf_counter()
+            write_cache(generate_venues(size, light=light), scratch)
+            if os.path.exists(os.path.join(ROOT, '.cache', 'historical_places.json')):
+                shutil.copy(os.path.join(ROOT, '.cache', 'historical_places.json'), os.path.join(scratch, '.cache'))
+            print(f"  generated in {time.perf_counter() - started:.1f}s")
+
+            out = os.path.join(scratch, "results.json")
+            command = [sys.executable, "-m", "benchmarks.run", "--child", out] + (["--only", *only] if only else [])
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+            subprocess.run(command, cwd=scratch, env=env, check=True)
+            with open(out) as f:
+                results["sizes"][str(size)] = json.load(f)
+    return results
+
+
+def compare(before: dict, after: dict, threshold: float = 1.2) -> int:
+    """
+    Print the median time ratio of every scenario both runs have, and return
+    how many got slower than `threshold`
+    """
+    regressions = 0
+    print(f"{before.get('commit') or '?'} -> {after.get('commit') or '?'}")
+    for size, old in before["sizes"].items():
+        new = after["sizes"].get(size)
+        if new is None:
+            continue
+        print(f"{size} venues")
+        for name, old_result in old["scenarios"].items():
+            new_result = new["scenarios"].get(name)
+            if new_result is None:
+                continue
+            ratio = new_result["median_us"] / old_result["median_us"]
+            flag = "REGRESSION" if ratio > threshold else ""
+            regressions += bool(flag)
+            print(f"  {name:<45} {old_result['median_us']:12.1f} -> {new_result['median_us']:12.1f} us  x{ratio:5.2f} {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths on synthetic venues")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000])
+    parser.add_argument("--light", action="store_true", help="small synthetic venues, for the largest sizes")
+    parser.add_argument("--only", nargs="+", help="run only the scenarios whose name contains one of these")
+    parser.add_argument("--out", help="where to write the JSON results")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.only)
+        return
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            sys.exit(1 if compare(json.load(f), json.load(g), args.threshold) else 0)
+
+    results = run(args.sizes, args.light, args.only)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Synthetic Foursquare-shaped venues for benchmarks.
+
+Every venue is a copy of one of the real `.cache` venues (so nested tips,
+photos, lists and hours have the real shape and size) with a new id, name,
+position, category, price, rating, crowd and idx. Positions are clustered
+around a few Riyadh hotspots like the real data. Real venues weigh ~16KB of
+JSON each; with `light` (or without a `.cache` to copy from) a small built-in
+template is used instead, which keeps 1M venues in a few GB. Run from the
+repo root:
+
+    python -m benchmarks.synthetic --venues 100000 --out /tmp/raya-100k
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from src.places_filter import ALLOWED_CATEGORIES
+
+# south, west, north, east (see src.swarm.RIYADH_BBOX)
+RIYADH_BBOX = (24.45, 46.45, 25.05, 46.95)
+HOTSPOTS = [(24.6911, 46.6852), (24.7136, 46.6753), (24.7743, 46.7386), (24.6319, 46.7130), (24.8167, 46.6400)]
+# real names from the Foursquare taxonomy that the allowed-category filter drops
+OTHER_CATEGORIES = ["Bank", "Gas Station", "Pharmacy", "Office", "Mosque", "Hospital", "Parking", "Dentist's Office"]
+PRICES = [None, (1, "Cheap"), (2, "Moderate"), (3, "Expensive"), (4, "Very Expensive")]
+
+FALLBACK_TEMPLATE = {
+    "id": "", "name": "", "contact": {}, "location": {"lat": 0, "lng": 0, "formattedAddress": ["Riyadh"]},
+    "categories": [], "verified": False, "stats": {"tipCount": 0}, "likes": {"count": 0, "groups": []},
+    "rating": 0, "hereNow": {"count": 0, "summary": "Nobody here", "groups": []},
+    "photos": {"count": 1, "groups": [{"type": "venue", "count": 1, "items": [{"prefix": "https://fastly.4sqi.net/img/general/", "suffix": "/synthetic.jpg"}]}]},
+    "tips": {"count": 1, "groups": [{"type": "others", "items": [{"text": "Great coffee and friendly staff"}]}]},
+    "phrases": [{"phrase": "great coffee", "sample": {"text": "Really great coffee here"}, "count": 3}],
+    "hours": {"status": "Open until 11:00 PM", "timeframes": [{"days": "Mon–Sun", "open": [{"renderedTime": "7:00 AM–11:00 PM"}]}]},
+}
+
+
+def load_templates(path: str = '.cache/venues_details.json') -> list[str]:
+    """
+    Real venues, JSON-encoded, to copy the shape of
+    """
+    if not os.path.exists(path):
+        return [json.dumps(FALLBACK_TEMPLATE)]
+    with open(path, 'r', encoding='utf-8') as f:
+        venues = json.load(f)
+    return [json.dumps(v, ensure_ascii=False) for v in venues.values()] or [json.dumps(FALLBACK_TEMPLATE)]
+
+
+def category_of(name: str) -> dict:
+    return {
+        "id": hashlib.md5(name.encode("utf-8")).hexdigest()[:24], "name": name, "pluralName": name + "s", "shortName": name,
+        "icon": {"prefix": "https://ss3.4sqi.net/img/categories_v2/food/default_", "suffix": ".png"}, "primary": True,
+    }
+
+
+def generate_venues(n: int, seed: int = 0, light: bool = False) -> dict[str, dict]:
+    """
+    `n` synthetic venues keyed by id, with idx 1..n
+    """
+    rng = random.Random(seed)
+    templates = [json.dumps(FALLBACK_TEMPLATE)] if light else load_templates()
+    allowed = sorted(ALLOWED_CATEGORIES)
+    categories = {name: category_of(name) for name in allowed + OTHER_CATEGORIES}
+    south, west, north, east = RIYADH_BBOX
+    now = time.time()
+
+    venues = {}
+    for idx in range(1, n + 1):
+        venue = json.loads(rng.choice(templates))
+        venue_id = format(rng.getrandbits(96), "024x")
+        if rng.random() < 0.7:
+            lat, lng = rng.choice(HOTSPOTS)
+            lat, lng = rng.gauss(lat, 0.03), rng.gauss(lng, 0.03)
+        else:
+            lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+
+        names = rng.sample(allowed, rng.randint(1, 2)) if rng.random() < 0.85 else [rng.choice(OTHER_CATEGORIES)]
+        venue['id'] = venue_id
+        venue['name'] = f"Venue {idx}"
+        venue['location'] = {**venue.get('location', {}), "lat": lat, "lng": lng}
+        venue['categories'] = [categories[name] for name in names]
+        price = rng.choice(PRICES)
+        if price:
+            venue['price'] = {"tier": price[0], "message": price[1], "currency": "$"}
+        else:
+            venue.pop('price', None)
+        venue['rating'] = round(rng.uniform(5, 9.8), 1)
+        venue['hereNow'] = {**venue.get('hereNow', {}), "count": int(rng.paretovariate(1.2)) - 1}
+        venue['likes'] = {**venue.get('likes', {}), "count": rng.randint(0, 5000)}
+        venue['idx'] = idx
+        venue['fetchedAt'] = now - rng.uniform(0, 60*60*12)
+        venues[venue_id] = venue
+    return venues
+
+
+def write_cache(venues: dict[str, dict], directory: str):
+    """
+    Lay out `venues` as a `.cache` directory under `directory`, the way
+    GEOCache reads it
+    """
+    os.makedirs(os.path.join(directory, '.cache'), exist_ok=True)
+    with open(os.path.join(directory, '.cache', 'venues_details.json'), 'w', encoding='utf-8') as f:
+        json.dump(venues, f, ensure_ascii=False)
+    ids = sorted(venues, key=lambda venue_id: venues[venue_id]['idx'])
+    with open(os.path.join(directory, '.cache', 'venues_ids.json'), 'w', encoding='utf-8') as f:
+        json.dump({str(idx): venue_id for idx, venue_id in enumerate(ids, start=1)}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--venues", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--light", action="store_true", help="small venues instead of copies of the real ones")
+    parser.add_argument("--out", required=True, help="directory to create the .cache folder in")
+    args = parser.parse_args()
+    write_cache(generate_venues(args.venues, args.seed, args.light), args.out)
+    print(f"Wrote {args.venues} venues to {os.path.join(args.out, '.cache')}")
+
+
+if __name__ == "__main__":
+    main()
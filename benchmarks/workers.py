@@ -0,0 +1,126 @@
+"""
+Multi-worker benchmark: query throughput and memory of N serving processes,
+each either loading the venues itself (standalone) or mapping the snapshot a
+writer published (reader).
+
+A synthetic `.cache` is generated in a scratch directory and published once to
+a snapshot file. For every worker count, that many processes start, load, and
+then run a mix of top-N, nearby, lookup and search queries for the same few
+seconds. Reported are the total queries per second and the workers' summed
+proportional set size (PSS, shared pages split between the processes that map
+them; Linux only, max RSS elsewhere). Run from the repo root:
+
+    python -m benchmarks.workers --venues 20000 --workers 1 2 4 --light
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.synthetic import generate_venues, write_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kib() -> tuple[str, int]:
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return "pss", int(line.split()[1])
+    except OSError:
+        pass
+    return "max_rss", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(seconds: float, seed: int):
+    from src.cache import cache
+    from src.enums import Categories, PriceTier
+
+    rng = random.Random(seed)
+    snapshot = cache.snapshot
+    idxs = list(range(1, len(snapshot.ids) + 1))
+    queries = [
+        lambda: cache.get_top_venues(5),
+        lambda: cache.get_top_venues(5, None, Categories.CAFE, PriceTier.CHEAP),
+        lambda: cache.get_top_venues(5, (rng.uniform(24.6, 24.8), rng.uniform(46.6, 46.8)), ranking="weighted"),
+        lambda: cache.get_venue_by_id(rng.choice(idxs)),
+        lambda: cache.search_venues("great coffee", 5, (rng.uniform(24.6, 24.8), rng.uniform(46.6, 46.8))),
+    ]
+    for query in queries:  # builds the lazy indexes of a standalone cache
+        query()
+    print("ready", flush=True)
+    sys.stdin.readline()
+
+    done, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        rng.choice(queries)()
+        done += 1
+    kind, kib = memory_kib()
+    print(json.dumps({"queries": done, "seconds": time.perf_counter() - started, kind: kib}), flush=True)
+
+
+def run(workers: int, role: str, scratch: str, seconds: float) -> dict:
+    env = {
+        **os.environ,
+        "RAYA_ROLE": role,
+        "RAYA_SNAPSHOT": os.path.join(scratch, "venues.snapshot"),
+        "RAYA_METRICS": "0",
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+    }
+    command = [sys.executable, "-m", "benchmarks.workers", "--child", str(seconds)]
+    children = [
+        subprocess.Popen(command + ["--seed", str(i)], cwd=scratch, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for i in range(workers)
+    ]
+    for child in children:
+        assert child.stdout.readline().strip() == "ready"
+    for child in children:
+        child.stdin.write("go\n")
+        child.stdin.flush()
+    results = [json.loads(child.stdout.readline()) for child in children]
+    for child in children:
+        child.wait()
+
+    kind = "pss" if "pss" in results[0] else "max_rss"
+    return {
+        "queries_per_s": sum(r["queries"] / r["seconds"] for r in results),
+        f"{kind}_mib": sum(r[kind] for r in results) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serving processes, standalone vs reading a shared snapshot")
+    parser.add_argument("--venues", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--light", action="store_true", help="small synthetic venues")
+    parser.add_argument("--roles", nargs="+", default=["standalone", "reader"], choices=["standalone", "reader"])
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--seed", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.seed)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="raya-workers-") as scratch:
+        write_cache(generate_venues(args.venues, light=args.light), scratch)
+        publish = "from src.cache import cache; from src.shared_snapshot import SnapshotPublisher; SnapshotPublisher(cache, 'venues.snapshot').write()"
+        env = {**os.environ, "RAYA_METRICS": "0", "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+        subprocess.run([sys.executable, "-c", publish], cwd=scratch, env=env, check=True)
+        size = sum(os.path.getsize(os.path.join(scratch, name)) for name in os.listdir(scratch) if name.startswith('venues.snapshot'))
+        print(f"{args.venues} venues, snapshot and blobs of {size / 2**20:.1f} MiB")
+
+        for role in args.roles:
+            for workers in args.workers:
+                result = run(workers, role, scratch, args.seconds)
+                print(f"  {role:<10} {workers:>2} workers  " + "  ".join(f"{k} {v:10.1f}" for k, v in result.items()), flush=True)
+
+
+if __name__ == "__main__":
+    main()
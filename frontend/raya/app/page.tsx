@@ -47,7 +47,8 @@ interface Venue {
 // Add this interface to type the chat request
 interface ChatRequest {
   message: string;
-  history: Message[];
+  history?: Message[];
+  session_id?: string;
 }
 
 const categories = [
@@ -97,6 +98,7 @@ export default function Page() {
       content: 'Welcome to Raya! I can help you discover amazing places in Saudi. What would you like to know about?'
     }])
     localStorage.removeItem('chatMessages')
+    localStorage.removeItem('chatSessionId')
   }
 
   useEffect(() => {
@@ -149,6 +151,7 @@ export default function Page() {
         },
         body: JSON.stringify({
           message: userMessage,
+          session_id: localStorage.getItem('chatSessionId') ?? undefined,
           // history: updatedMessages // Send the entire chat history including the new message
         } as ChatRequest),
       })
@@ -156,6 +159,7 @@ export default function Page() {
       if (!response.ok) throw new Error('Failed to send message')
       
       const data = await response.json()
+      if (data.session_id) localStorage.setItem('chatSessionId', data.session_id)
       setMessages(prev => [...prev, { role: 'assistant', content: data.message }])
     } catch (error) {
       console.error('Error sending message:', error)
@@ -7,15 +7,62 @@ import json
 from langchain_core.messages import ToolMessage
 import requests
 from langgraph.graph import MessagesState
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, RemoveMessage, trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import RunnableLambda
 from langgraph.prebuilt import tools_condition, ToolNode
 from src.cache import cache
 from src.cache import Categories, PriceTier
+from src import metrics
 import os
+from contextlib import contextmanager
+from functools import wraps
 os.environ["OPENAI_API_KEY"] = "api_key"
 
 
-def chatbot(sysMessage: str, tools: List[Callable[..., Any]]):
+@contextmanager
+def llm_call(mode: str):
+    """ Times an LLM call and counts it by outcome """
+    outcome = "ok"
+    try:
+        with metrics.llm_seconds.time(mode=mode):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        metrics.llm_calls.inc(mode=mode, outcome=outcome)
+
+
+def count_tokens(response: AIMessage):
+    usage = getattr(response, "usage_metadata", None) or {}
+    for kind in ("input_tokens", "output_tokens"):
+        if usage.get(kind):
+            metrics.llm_tokens.inc(usage[kind], kind=kind.removesuffix("_tokens"))
+
+
+def instrumented_tool(fn: Callable) -> Callable:
+    """ Wrap a tool function so its invocations are timed and counted """
+    if not metrics.registry.enabled:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        outcome = "ok"
+        try:
+            with metrics.tool_seconds.time(tool=fn.__name__):
+                return fn(*args, **kwargs)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            metrics.tool_calls.inc(tool=fn.__name__, outcome=outcome)
+    return wrapper
+
+
+def chatbot(sysMessage: str, tools: List[Callable[..., Any]], llm: BaseChatModel = None, checkpointer: BaseCheckpointSaver = None, history_tokens: int = 4000):
     def fetch_page(url: str) -> Union[requests.Response, str]:
         """
         Fetches a webpage using an HTTP GET request.
@@ -37,8 +84,13 @@ def chatbot(sysMessage: str, tools: List[Callable[..., Any]]):
         except requests.exceptions.RequestException:
             return "Error fetching URL"
 
-    llm = ChatOpenAI(model="gpt-4o")
-    llm_with_tools = llm.bind_tools(tools)
+    llm = llm or ChatOpenAI(model="gpt-4o")
+    tools = [instrumented_tool(t) for t in tools]
+    try:
+        llm_with_tools = llm.bind_tools(tools)
+    except NotImplementedError:
+        # models without tool binding (e.g. langchain's fake chat models) answer with scripted tool calls as they are
+        llm_with_tools = llm
 
     sysMessage = SystemMessage(content=sysMessage)
  
@@ -58,19 +110,51 @@ def chatbot(sysMessage: str, tools: List[Callable[..., Any]]):
 
     #     return {"messages": [response]}
     
-    def assistant(state: MessagesState):
+    def history(state: MessagesState) -> tuple[list, list]:
+        # the current turn (from its human message on) is always kept whole; earlier turns are kept,
+        # latest first, while they fit in what is left of history_tokens and dropped from the thread otherwise
+        messages = state["messages"]
+        start = next((i for i in range(len(messages) - 1, -1, -1) if messages[i].type == "human"), 0)
+        budget = history_tokens - count_tokens_approximately(messages[start:])
+        earlier = trim_messages(messages[:start], max_tokens=budget, token_counter=count_tokens_approximately,
+                                strategy="last", start_on="human") if budget > 0 else []
+        kept = earlier + messages[start:]
+        kept_ids = {m.id for m in kept}
+        dropped = [RemoveMessage(id=m.id) for m in messages if m.id not in kept_ids]
+        return kept, dropped
+
+    def prompt(config: dict) -> list:
+        # the system message, and where the user is when the request says so (config's "location")
+        location = ((config or {}).get("configurable") or {}).get("location")
+        if location is None:
+            return [sysMessage]
+        return [sysMessage, SystemMessage(content=f"The user is at these coordinates: lat: {location[0]}, lng: {location[1]}")]
+
+    def assistant(state: MessagesState, config: dict):
         # check if the dictionary returns the correct states
-        return {"messages": [llm_with_tools.invoke([sysMessage] + state["messages"])]}
+        kept, dropped = history(state)
+        with llm_call("sync"):
+            response = llm_with_tools.invoke(prompt(config) + kept)
+        count_tokens(response)
+        return {"messages": dropped + [response]}
+
+    async def aassistant(state: MessagesState, config: dict):
+        kept, dropped = history(state)
+        with llm_call("async"):
+            response = await llm_with_tools.ainvoke(prompt(config) + kept)
+        count_tokens(response)
+        return {"messages": dropped + [response]}
 
 
     builder = StateGraph(MessagesState)
-    builder.add_node("assistant", assistant)
+    # the async variant runs when the graph is driven through astream/ainvoke
+    builder.add_node("assistant", RunnableLambda(assistant, afunc=aassistant))
     builder.add_node("tools", ToolNode(tools))
 
     builder.add_edge(START, "assistant")
     builder.add_conditional_edges("assistant", tools_condition,)
     builder.add_edge("tools", "assistant")
 
-    graph = builder.compile()
+    graph = builder.compile(checkpointer=checkpointer)
     return graph
 
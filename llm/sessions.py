@@ -0,0 +1,178 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+from rich import print
+
+
+def make_checkpointer(kind: str = os.environ.get("RAYA_CHECKPOINTER", "memory"), path: str = ".cache/sessions.sqlite3") -> BaseCheckpointSaver:
+    """
+    Build the checkpointer that stores conversation state: "memory" (default)
+    or "sqlite", which needs the langgraph-checkpoint-sqlite package.
+    """
+    if kind == "memory":
+        return InMemorySaver()
+    if kind == "sqlite":
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        class ThreadedSqliteSaver(SqliteSaver):
+            """ SqliteSaver whose async methods run the sync ones on a worker thread, so it also serves astream """
+            async def aget_tuple(self, config):
+                return await asyncio.to_thread(self.get_tuple, config)
+
+            async def alist(self, config, *, filter=None, before=None, limit=None):
+                items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+                for item in items:
+                    yield item
+
+            async def aput(self, config, checkpoint, metadata, new_versions):
+                return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+            async def aput_writes(self, config, writes, task_id, task_path=""):
+                return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+            async def adelete_thread(self, thread_id):
+                return await asyncio.to_thread(self.delete_thread, thread_id)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    raise ValueError(f"Unknown checkpointer: {kind}")
+
+
+class MemoryActivity:
+    """
+    Last-seen times of the sessions served by this process, in LRU order
+    """
+    def __init__(self):
+        self.sessions: OrderedDict[str, float] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def touch(self, session_id: str, now: float):
+        with self.lock:
+            self.sessions[session_id] = now
+            self.sessions.move_to_end(session_id)
+
+    def expire(self, now: float, idle_ttl: float, max_sessions: int) -> list[str]:
+        """
+        Forget and return the sessions idle for `idle_ttl` and the least recent
+        ones past `max_sessions`
+        """
+        evicted = []
+        with self.lock:
+            while self.sessions:
+                session_id, last_seen = next(iter(self.sessions.items()))
+                if len(self.sessions) <= max_sessions and now - last_seen < idle_ttl:
+                    break
+                self.sessions.popitem(last=False)
+                evicted.append(session_id)
+        return evicted
+
+
+class SQLiteActivity:
+    """
+    Last-seen times in a table of the checkpoint database, so every worker
+    process sharing the database sees the same activity and sessions from
+    before a restart still expire.
+    """
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS sessions (thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+            # threads checkpointed before last-seen times were kept start their clock now
+            if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'checkpoints'").fetchone():
+                self.conn.execute("INSERT OR IGNORE INTO sessions SELECT DISTINCT thread_id, ? FROM checkpoints", (time.time(),))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def touch(self, session_id: str, now: float):
+        with self.lock:
+            self.conn.execute("INSERT INTO sessions VALUES (?, ?) ON CONFLICT (thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+                              (session_id, now))
+
+    def expire(self, now: float, idle_ttl: float, max_sessions: int) -> list[str]:
+        with self.lock:
+            # one write transaction, so two workers never pick the same sessions
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                evicted = [row[0] for row in self.conn.execute("SELECT thread_id FROM sessions WHERE last_seen <= ?", (now - idle_ttl,))]
+                over = self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - len(evicted) - max_sessions
+                if over > 0:
+                    evicted += [row[0] for row in self.conn.execute(
+                        "SELECT thread_id FROM sessions WHERE last_seen > ? ORDER BY last_seen LIMIT ?", (now - idle_ttl, over))]
+                self.conn.executemany("DELETE FROM sessions WHERE thread_id = ?", [(session_id,) for session_id in evicted])
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return evicted
+
+
+def make_activity(checkpointer: BaseCheckpointSaver):
+    """
+    Where last-seen times are kept: next to the checkpoints when they are in a
+    SQLite file, in memory otherwise
+    """
+    conn = getattr(checkpointer, "conn", None)
+    if isinstance(conn, sqlite3.Connection):
+        path = conn.execute("PRAGMA database_list").fetchone()[2]
+        if path:
+            return SQLiteActivity(path)
+    return MemoryActivity()
+
+
+class SessionStore:
+    """
+    Maps chat sessions to checkpointer threads and evicts old ones.
+
+    Every message records its session's last-seen time. Every `interval`
+    seconds, the threads of sessions idle for `idle_ttl` seconds and of the
+    least recent sessions past `max_sessions` are deleted from the checkpointer.
+    """
+    def __init__(self, checkpointer: BaseCheckpointSaver = None, max_sessions: int = 1000, idle_ttl: float = 60*30, interval: float = 60):
+        self.checkpointer = checkpointer or make_checkpointer()
+        self.activity = make_activity(self.checkpointer)
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.start_eviction(interval)
+
+    def __len__(self):
+        return len(self.activity)
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def config(self, session_id: str) -> dict:
+        """
+        Mark the session active and return the graph config for its thread
+        """
+        self.activity.touch(session_id, time.time())
+        return {"configurable": {"thread_id": session_id}}
+
+    def evict_idle(self):
+        for thread_id in self.activity.expire(time.time(), self.idle_ttl, self.max_sessions):
+            self.checkpointer.delete_thread(thread_id)
+
+    def start_eviction(self, interval: float):
+        def evict():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    print(f"[red]Evicting idle sessions failed: {e!r}[/red]")
+
+        thread = threading.Thread(target=evict, daemon=True)
+        thread.start()
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, Iterator
+
+
+class AsyncRunner:
+    """
+    Event loop on a background thread that sync code (Flask handlers) can hand
+    coroutines to. All streamed chats share it, so waiting on the LLM or on
+    tools doesn't occupy a thread per chat.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+runner = AsyncRunner()
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_chat(graph, inputs: dict, config: dict = None, on_done: Callable[[str], None] = None) -> Iterator[str]:
+    """
+    Run the chatbot graph on the shared event loop and yield server-sent events
+    as it goes: `token` for each assistant token, `tool_call` when the assistant
+    asks for tools, `tool_result` as each tool returns, then `done` with the
+    final message (or `error`). `on_done` is called with the final message.
+    """
+    events: queue.Queue = queue.Queue()
+
+    async def produce():
+        final = None
+        try:
+            async for mode, chunk in graph.astream(inputs, config, stream_mode=["messages", "updates"]):
+                if mode == "messages":
+                    message, metadata = chunk
+                    if metadata.get("langgraph_node") == "assistant" and isinstance(message.content, str) and message.content:
+                        events.put(("token", {"content": message.content}))
+                    continue
+
+                for node, update in (chunk or {}).items():
+                    for message in (update or {}).get("messages", []):
+                        if node == "assistant" and message.type == "ai":
+                            final = message
+                            if message.tool_calls:
+                                events.put(("tool_call", [{"name": c["name"], "args": c["args"]} for c in message.tool_calls]))
+                        elif node == "tools":
+                            events.put(("tool_result", {"name": message.name, "tool_call_id": message.tool_call_id}))
+
+            answer = final.content if final else ""
+            if on_done and answer:
+                on_done(answer)
+            events.put(("done", {"message": answer}))
+        except Exception as e:
+            events.put(("error", {"error": str(e)}))
+        finally:
+            events.put(None)
+
+    future = runner.submit(produce())
+    try:
+        while (item := events.get()) is not None:
+            yield sse(*item)
+    finally:
+        # client went away before the graph finished
+        future.cancel()
@@ -0,0 +1,140 @@
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, similarities are then summed in python
+    np = None
+
+
+# words that don't change what is asked; everything else (negations, days, categories,
+# amenities, numbers) has to match exactly for a cached answer to be reused
+FILLER_WORDS = frozenset({"a", "an", "the", "is", "are", "me", "i", "my", "to", "of", "in", "at", "on", "for", "and",
+                          "please", "can", "could", "you", "what", "which", "where", "some", "any", "show", "give", "tell"})
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+def content_words(normalized: str) -> frozenset[str]:
+    return frozenset(normalized.split()) - FILLER_WORDS
+
+
+def embed(text: str, dim: int = 256) -> list[float]:
+    """
+    Local bag-of-features embedding: words and character trigrams hashed into
+    `dim` buckets, L2-normalized. Good enough to spot rephrasings and typos
+    of the same question without calling out to an embedding model.
+    """
+    vector = [0.0] * dim
+    words = text.split()
+    features = words + [w[i:i + 3] for w in (f" {w} " for w in words) for i in range(len(w) - 2)]
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector[h % dim] += 1.0 if (h >> 63) & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def location_bucket(location: tuple[float, float]|None, cell: float = 0.01) -> tuple[int, int]|None:
+    if location is None:
+        return None
+    return round(location[0] / cell), round(location[1] / cell)
+
+
+class AnswerCache:
+    """
+    Bounded cache of chat answers.
+
+    Entries are scoped by the user's location bucket and a conversation context
+    key (e.g. the previous assistant message), and only hold for the data
+    version they were answered at. A lookup first tries the exact normalized
+    query, then the most similar cached query in the same scope above
+    `threshold` cosine similarity, among the `max_candidates` latest answers of
+    the scope. A similar query only counts when it has exactly the same content
+    words, so rephrasings and word order match but "indoor"/"outdoor" or
+    "with"/"without" never do. Similarities are computed outside the lock. Eviction is LRU, bounded by `max_entries` and by
+    `max_bytes` of stored answers.
+    """
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 8_000_000, threshold: float = 0.95, max_candidates: int = 256):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.entries: OrderedDict[tuple, dict] = OrderedDict()
+        # scope -> its keys, oldest first
+        self.scopes: dict[tuple, dict] = {}
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _scope(location: tuple[float, float]|None, context: str) -> tuple:
+        return location_bucket(location), hashlib.blake2b(context.encode('utf-8'), digest_size=8).hexdigest()
+
+    def get(self, query: str, version: int, location: tuple[float, float] = None, context: str = "") -> str|None:
+        normalized = normalize_query(query)
+        scope = self._scope(location, context)
+        candidates = []
+        with self.lock:
+            entry = self.entries.get((scope, normalized))
+            if entry is None:
+                words = content_words(normalized)
+                keys = list(self.scopes.get(scope, ()))[-self.max_candidates:]
+                candidates = [c for c in map(self.entries.__getitem__, keys) if c["version"] == version and c["words"] == words]
+
+        if candidates:
+            vector = embed(normalized)
+            if np is not None:
+                similarities = np.stack([c["vector"] for c in candidates]) @ np.asarray(vector, dtype=np.float32)
+            else:
+                similarities = [sum(a * b for a, b in zip(vector, c["vector"])) for c in candidates]
+            best = max(range(len(candidates)), key=similarities.__getitem__)
+            if similarities[best] >= self.threshold:
+                entry = candidates[best]
+
+        with self.lock:
+            if entry is None or entry["version"] != version:
+                self.misses += 1
+                return None
+            if entry["key"] in self.entries:
+                self.entries.move_to_end(entry["key"])
+            self.hits += 1
+            return entry["answer"]
+
+    def put(self, query: str, answer: str, version: int, location: tuple[float, float] = None, context: str = ""):
+        normalized = normalize_query(query)
+        key = (self._scope(location, context), normalized)
+        vector = embed(normalized)
+        entry = {"key": key, "answer": answer, "version": version, "vector": vector if np is None else np.asarray(vector, dtype=np.float32),
+                 "words": content_words(normalized), "size": len(answer.encode('utf-8'))}
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = entry
+            self.scopes.setdefault(key[0], {})[key] = None
+            self.size += entry["size"]
+            self._evict(version)
+
+    def _remove(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry["size"]
+        keys = self.scopes[key[0]]
+        keys.pop(key, None)
+        if not keys:
+            del self.scopes[key[0]]
+
+    def _evict(self, version: int):
+        for key in [k for k, e in self.entries.items() if e["version"] != version]:
+            self._remove(key)
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            self._remove(next(iter(self.entries)))
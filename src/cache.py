@@ -2,121 +2,333 @@ import os
 import json
 import threading
 import time
-import hashlib
+from abc import ABC, abstractmethod
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from itertools import islice
+from rich import print
 from src.enums import Categories, PriceTier
-from copy import deepcopy
-from src.places_filter import filter_venues, classify_category
+from src.storage import StorageBackend, JsonBackend, make_backend
+from src.metrics import registry, cache_query_seconds, flush_seconds, flushed_keys
+from src.venue_index import VenueIndex
+from src.records import VenueRecord
+from src.search import SearchIndex
 
 class Cache(dict):
-    def __init__(self, filename: str):
+    """
+    Dict persisted through a `StorageBackend`.
+
+    Writes bump `version` and mark their key dirty; `save_to_filesystem` hands
+    only the dirty keys to the backend and does nothing when the version has not
+    moved. With a lazy backend only the entries that were read or written live
+    in memory and the rest are fetched on demand; without `resident`, entries
+    are not kept once fetched and are dropped from memory once flushed, so the
+    backend is a cold store.
+    """
+    def __init__(self, filename: str, backend: StorageBackend = None, resident: bool = True):
         super().__init__()
         self.filename = filename
+        self.backend = backend or JsonBackend(filename)
+        self.resident = resident or not self.backend.lazy
+        self.version = 0
+        self._saved_version = 0
+        # dirty key -> version of its last write
+        self._dirty: dict = {}
+        self.lock = threading.RLock()
+
+    def touch(self, key):
+        """
+        Mark a key dirty after mutating its value in place
+        """
+        with self.lock:
+            self.version += 1
+            self._dirty[key] = self.version
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+            self.touch(key)
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._fetch(key)
+            super().__delitem__(key)
+            self.touch(key)
+
+    def __missing__(self, key):
+        value = self._fetch(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or self._fetch(key) is not None
+
+    def get(self, key, default=None):
+        value = super().get(key)
+        if value is None:
+            value = self._fetch(key)
+        return default if value is None else value
+
+    def _fetch(self, key):
+        """
+        Pull an entry from a lazy backend into memory
+        """
+        if not self.backend.lazy or super().__contains__(key) or key in self._dirty:
+            return super().get(key)
+        value = self.backend.get(key)
+        if value is not None and self.resident:
+            with self.lock:
+                super().setdefault(key, value)
+        return value
+
+    def pop(self, key, *args):
+        with self.lock:
+            if key in self:
+                self.touch(key)
+            return super().pop(key, *args)
+
+    def setdefault(self, key, default=None):
+        with self.lock:
+            if key not in self:
+                self[key] = default
+            return self[key]
+
+    def update(self, *args, **kwargs):
+        with self.lock:
+            for key, value in dict(*args, **kwargs).items():
+                self[key] = value
 
     def clear_all(self):
-        self.clear()
+        with self.lock:
+            for key in list(self.all_keys()):
+                del self[key]
 
-    def _compute_hash(self, data: dict) -> str:
-        return hashlib.md5(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+    def all_keys(self) -> set:
+        with self.lock:
+            keys = set(self.keys()) | (self.backend.keys() if self.backend.lazy else set())
+            return {k for k in keys if dict.__contains__(self, k) or k not in self._dirty}
+
+    def all_items(self):
+        """
+        Iterate every entry, including the ones a lazy backend has not loaded yet
+        """
+        yield from list(self.items())
+        if self.backend.lazy:
+            for key, value in self.backend.items():
+                if not super().__contains__(key) and key not in self._dirty:
+                    yield key, value
 
     def save_to_filesystem(self):
-        temp_data = self.copy()
-        current_hash = self._compute_hash(temp_data)
-        if current_hash == self._compute_hash(self._read_from_filesystem() or {}):
-            return
-
-        os.makedirs(".cache", exist_ok=True)
-
-        temp_file = f'.cache/{self.filename}.tmp'
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(temp_data, f, ensure_ascii=False)
-        os.replace(temp_file, f'.cache/{self.filename}')
-
-    def _read_from_filesystem(self) -> dict|None:
-        if os.path.exists(f'.cache/{self.filename}'):
-            with open(f'.cache/{self.filename}', 'r', encoding='utf-8') as f:
-                return json.load(f)
-            
-    def load_from_filesystem(self):
-        data = self._read_from_filesystem()
-        if not data:
-            return
-        self.update(data)
+        with self.lock:
+            if self.version == self._saved_version:
+                return
+            version = self.version
+            dirty = dict(self._dirty)
+            changes = {k: json.dumps(dict.__getitem__(self, k), ensure_ascii=False) if dict.__contains__(self, k) else None for k in dirty}
+            snapshot = json.dumps(self, ensure_ascii=False) if self.backend.wants_snapshot(len(changes)) else None
 
+        # keys stay dirty until the backend has them, so a failed flush is retried
+        with flush_seconds.time(cache=self.filename):
+            self.backend.flush(changes, snapshot)
+        flushed_keys.inc(len(changes), cache=self.filename)
 
-class GEOCache:
-    def __init__(self):
-        self.venues: Cache = Cache("venues_details.json")
-        self.venues_ids: Cache = Cache("venues_ids.json")
-        
-        self.venues.load_from_filesystem()
-        self.venues_ids.load_from_filesystem()
-        self.start_sync()
+        with self.lock:
+            for key, key_version in dirty.items():
+                if self._dirty.get(key) != key_version:
+                    continue  # written again during the flush
+                del self._dirty[key]
+                if not self.resident:
+                    dict.pop(self, key, None)
+            self._saved_version = version
 
-    def get_venue_index(self, venue_id: str) -> int|None:
+    def settle(self, key, old, new):
         """
-        Get the index of a venue in the cache incremented by 1
+        Swap an in-memory value for an equal one (e.g. its frozen copy) without
+        marking it dirty, unless it was written in the meantime
         """
-        if venue_id not in self.venues_ids.get('ids', []):
-            self.venues_ids.setdefault('ids', []).append(venue_id)
-        return self.venues_ids.get('ids', []).index(venue_id) + 1
+        with self.lock:
+            if dict.get(self, key) is old:
+                dict.__setitem__(self, key, new)
 
-    def start_sync(self, interval: int = 5):
-        def sync():
-            while True:
-                self.venues.save_to_filesystem()
-                self.venues_ids.save_to_filesystem()
-                time.sleep(interval)
+    def load_from_filesystem(self):
+        data = self.backend.load()
+        with self.lock:
+            dict.update(self, data)
+            self._saved_version = self.version
 
-        thread = threading.Thread(target=sync, daemon=True)
-        thread.start()
 
-    def clean_venue_details(self, venue: dict) -> dict:
-        venue.pop('id', None)
-        venue.pop('canonicalUrl', None)
-        venue.pop('popular', None)
-        venue.pop('listed', None) # TODO: parse
-        venue.pop('phrases', None) # TODO: parse
-        venue.pop('tips', None) # TODO: parse
-        venue.pop('storeId', None)
-        venue.pop('photos', None)
-        venue.pop('menu', None)
-        venue.pop('header', None)
-        venue.pop('ratingColor', None)
-        venue.pop('ratingSignals', None)
-        venue.pop('explanation', None)
-        if venue.get('likes', None):
-            venue['likes'].pop('groups', None)
-        if venue.get('hereNow', None):
-            venue['hereNow'].pop('groups', None)
-
-        venue.pop('stats', None)
-        try:
-            venue['categories'] = [i['name'] for i in venue['categories']]
-        except:
-            pass
-        venue['location'] = {
-            "lat": venue['location']['lat'],
-            "lng": venue['location']['lng'],
-            "address": venue.get('location', {}).get('formattedAddress', {})
-        }
+class FrozenDict(dict):
+    """
+    Read-only dict, handed out instead of deep copies of cache entries. Nested
+    values are frozen too: dicts become FrozenDicts and lists tuples.
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, ((key, freeze(value)) for key, value in dict(*args, **kwargs).items()))
 
-        return venue
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("FrozenDict is read-only")
 
-    def get_top_venues(self, n: int=5, location: tuple[float, float] = None, category: Categories = Categories.ALL, price_tier: PriceTier = PriceTier.ALL) -> list[dict]:
-        venues = filter_venues([self.clean_venue_details(i) for i in deepcopy(self.venues).values()])
-        venues = sorted(venues, key=lambda x: max(x.get('rating', 0), 6)/2 * x['hereNow']['count'], reverse=True)
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
 
-        for venue in venues:
-            venue['categoryEnum'] = [classify_category(c) for c in venue['categories']]
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+def freeze(value):
+    """
+    Read-only copy of a JSON-like value, sharing whatever is already frozen
+    """
+    if isinstance(value, dict) and not isinstance(value, FrozenDict):
+        return FrozenDict(value)
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class Overlay(Mapping):
+    """
+    Read-only mapping: a `base` dict shared between generations with the
+    entries changed since it was built laid over it. `updated` copies only the
+    overlay and folds it into a new base once it outgrows the square root of
+    the base, so a write costs O(sqrt n) amortized instead of a full copy.
+    Neither dict is modified once the mapping exists.
+    """
+    __slots__ = ("base", "overlay", "size")
+
+    def __init__(self, base: dict, overlay: dict = None):
+        self.base = base
+        self.overlay = overlay or {}
+        self.size = len(base) + sum(1 for key in self.overlay if key not in base)
+
+    def __getitem__(self, key):
+        if key in self.overlay:
+            return self.overlay[key]
+        return self.base[key]
+
+    def get(self, key, default=None):
+        if key in self.overlay:
+            return self.overlay[key]
+        return self.base.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.overlay or key in self.base
+
+    def __iter__(self):
+        yield from self.base
+        yield from (key for key in self.overlay if key not in self.base)
+
+    def __len__(self):
+        return self.size
+
+    def updated(self, changes: dict) -> "Overlay":
+        overlay = {**self.overlay, **changes}
+        if len(overlay) ** 2 > len(self.base):
+            return Overlay({**self.base, **overlay})
+        return Overlay(self.base, overlay)
+
+
+class Prefix(Sequence):
+    """
+    The first `length` items of a list that is only ever appended to: a fixed
+    view the generations share instead of each copying the list
+    """
+    __slots__ = ("items", "length")
+
+    def __init__(self, items: list, length: int):
+        self.items = items
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.items[j] for j in range(self.length)[i]]
+        return self.items[range(self.length)[i]]
+
+    def __iter__(self):
+        return islice(self.items, self.length)
+
+
+class Snapshot:
+    """
+    One immutable generation of the venue set: compact venue records by
+    Foursquare id and the ids by idx. Generations are never modified once published, so readers
+    can hold on to one without locks or copies.
+    """
+    __slots__ = ("venues", "ids", "version")
+
+    def __init__(self, venues: Mapping[str, VenueRecord], ids: Sequence[str], version: int):
+        self.venues = venues
+        self.ids = ids
+        self.version = version
+
+    def id_of(self, idx: int) -> str|None:
+        return self.ids[idx - 1] if 0 < idx <= len(self.ids) else None
+
+
+class VenueReader(ABC):
+    """
+    Read API over the venues, shared by the stores. Subclasses provide
+    `snapshot` (the current `Snapshot`), `index` (a VenueIndex or compatible
+    view), `search_index` (a SearchIndex or compatible view) and `raw`. Each
+    query takes all three from one `current()` call, so it reads a single
+    generation even if a new one is published meanwhile.
+    """
+    def current(self) -> tuple:
+        """
+        The current generation with the venue and search indexes matching it
+        """
+        return self.snapshot, self.index, self.search_index
+
+    @abstractmethod
+    def raw(self, venue_id: str|None, snapshot: Snapshot = None) -> FrozenDict|None:
+        """
+        The full Foursquare venue, for details, ratings and snippets, from
+        `snapshot` (default the current generation) where the store keeps raw
+        venues per generation
+        """
+
+    def resolve_venue_id(self, venue_id: str|int, snapshot: Snapshot = None) -> str|None:
+        """
+        Map a venue idx (int or numeric string) or a Foursquare id to the Foursquare id
+        """
+        snapshot = snapshot or self.snapshot
+        if isinstance(venue_id, int) or str(venue_id).strip().isdigit():
+            return snapshot.id_of(int(venue_id))
+        if venue_id in snapshot.venues:
+            return venue_id
+        return None
+
+    @property
+    def version(self) -> int:
+        """
+        Data version of the published generation
+        """
+        return self.snapshot.version
 
-        if category != Categories.ALL:
-            venues = [i for i in venues if any(classify_category(c) == category for c in i['categories'])]
+    @registry.timed(cache_query_seconds, method="get_top_venues")
+    def get_top_venues(self, n: int=5, location: tuple[float, float] = None, category: Categories = Categories.ALL, price_tier: PriceTier = PriceTier.ALL, radius_km: float = None, ranking: str = "score") -> list[dict]:
+        return self.index.top(n, category, price_tier, location, radius_km, ranking)
 
-        if price_tier != PriceTier.ALL:
-            venues = [i for i in venues if price_tier.value in i['price']]
+    @registry.timed(cache_query_seconds, method="search_venues")
+    def search_venues(self, query: str, n: int = 5, location: tuple[float, float] = None, category: Categories = Categories.ALL, price_tier: PriceTier = PriceTier.ALL, radius_km: float = None) -> list[dict]:
+        """
+        Venues whose name, phrases, tips or lists best match `query` (BM25), with
+        the same filters as get_top_venues. Each result lists the matching text
+        under `matches`.
+        """
+        snapshot, index, search_index = self.current()
+        ranked = search_index.ranked(query)
+        venues = index.select(ranked, n, category, price_tier, location, radius_km)
+        for venue in venues:
+            raw = self.raw(snapshot.id_of(venue.get('idx', 0)), snapshot) or {}
+            venue['matches'] = SearchIndex.snippets(raw, query)
+        return venues
 
-        return venues[:n]
-    
+    @registry.timed(cache_query_seconds, method="get_venue_ratings")
     def get_venue_ratings(self, venue_id: str) -> list[dict]:
         venue: dict = self.get_venue_by_id(venue_id)
         if not venue:
@@ -127,18 +339,230 @@ class GEOCache:
             for item in group.get('items', []):
                 lists.append(f"{item.get('text', '')} - {item.get('description', '')}")
 
-        comments = [i['text'] for i in venue.get('phrases', [])] 
+        comments = [i.get('sample', {}).get('text', i.get('phrase', '')) for i in venue.get('phrases', [])]
         for group in venue.get('tips', {}).get('groups', []):
             for item in group.get('items', []):
                 comments.append(item.get('text', ''))
 
         return comments
 
-    def get_venue_by_id(self, venue_id: str) -> dict:
-        for v in deepcopy(self.venues).values():
-            if v['idx'] == venue_id:
-                return v
-        return {}
+    @registry.timed(cache_query_seconds, method="get_venue_by_id")
+    def get_venue_by_id(self, venue_id: str|int) -> dict:
+        """
+        Look up the full venue by idx or Foursquare id
+        """
+        snapshot = self.snapshot
+        return self.raw(self.resolve_venue_id(venue_id, snapshot), snapshot) or {}
+
+
+class GEOCache(VenueReader):
+    """
+    Venue store shared by the swarm worker and the Flask handlers.
+
+    Raw Foursquare venues are kept in `venues`, the persisted store, and only
+    read back for details, ratings and search snippets. Every venue is also
+    normalized into a compact `VenueRecord` when it is stored, which is what the
+    generations, the indexes and the map hold. With `raw_store="cold"` the raw
+    venues live in SQLite and are not kept in memory.
+
+    Readers use `snapshot`, the current immutable generation, built from the
+    store on first use. Writers stage venues with `set_venue` under a single
+    write lock; `publish` lays the staged venues over the previous generation
+    (see `Overlay`) and swaps the new one in with one assignment. Inside
+    `batch()` generations are published every `publish_every` writes and when
+    the batch ends, otherwise after every write.
+    """
+    def __init__(self, backend: str = os.environ.get("RAYA_CACHE_BACKEND", "json"), raw_store: str = os.environ.get("RAYA_RAW_STORE", "resident"), publish_every: int = 256):
+        if raw_store not in ("resident", "cold"):
+            raise ValueError(f"Unknown raw store: {raw_store}")
+        cold = raw_store == "cold"
+        self.venues: Cache = Cache("venues_details.json", make_backend("sqlite" if cold else backend, "venues_details.json"), resident=not cold)
+        self.venues_ids: Cache = Cache("venues_ids.json", make_backend(backend, "venues_ids.json"))
+        
+        self.venues.load_from_filesystem()
+        self.venues_ids.load_from_filesystem()
+
+        self._ids: list[str] = self._load_ids()
+        self._idx_by_id: dict[str, int] = {venue_id: i for i, venue_id in enumerate(self._ids, start=1)}
+        self._snapshot: Snapshot|None = None
+
+        self.publish_every = publish_every
+        # venue id -> (record, raw venue) waiting for the next generation
+        self._staged: dict[str, tuple[VenueRecord, FrozenDict]] = {}
+        self._batches = 0
+        self._write_lock = threading.RLock()
+        self._index: VenueIndex|None = None
+        self._search_index: SearchIndex|None = None
+        self.start_sync()
+
+    @property
+    def snapshot(self) -> Snapshot:
+        """
+        The current generation. The first one is built on first use, so opening a
+        lazy store doesn't read every venue.
+        """
+        if self._snapshot is None:
+            with self._write_lock:
+                if self._snapshot is None:
+                    records = {venue_id: VenueRecord.from_raw(venue_id, venue) for venue_id, venue in self.venues.all_items()}
+                    self._snapshot = Snapshot(Overlay(records), Prefix(self._ids, len(self._ids)), self.venues.version)
+        return self._snapshot
+
+    @property
+    def index(self) -> VenueIndex:
+        """
+        The venue index, built from the cache on first use
+        """
+        if self._index is None:
+            # built under the write lock so no generation is published halfway through
+            with self._write_lock:
+                if self._index is None:
+                    index = VenueIndex()
+                    index.build(self.snapshot.venues)
+                    self._index = index
+        return self._index
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """
+        Full-text index of the venues' names, phrases, tips and lists, built on
+        first use from the raw venues
+        """
+        if self._search_index is None:
+            with self._write_lock:
+                if self._search_index is None:
+                    search_index = SearchIndex()
+                    for venue_id, venue in self.venues.all_items():
+                        search_index.add(venue_id, venue)
+                    self._search_index = search_index
+        return self._search_index
+
+    def _load_ids(self) -> list[str]:
+        """
+        Venue ids by idx. Every idx is persisted under its own key, so a new venue
+        adds one small journal entry; a single 'ids' list from older caches is
+        split up on load.
+        """
+        with self.venues_ids.lock:
+            legacy = self.venues_ids.get('ids')
+            if legacy is not None:
+                for idx, venue_id in enumerate(legacy, start=1):
+                    self.venues_ids[str(idx)] = venue_id
+                del self.venues_ids['ids']
+            ids = dict(self.venues_ids.all_items())
+        return [ids[str(idx)] for idx in range(1, len(ids) + 1)]
+
+    def get_venue_index(self, venue_id: str) -> int:
+        """
+        Get the index of a venue in the cache incremented by 1, assigning the next
+        one if the venue is new
+        """
+        idx = self._idx_by_id.get(venue_id)
+        if idx is not None:
+            return idx
+
+        with self._write_lock:
+            if venue_id not in self._idx_by_id:
+                self._ids.append(venue_id)
+                self.venues_ids[str(len(self._ids))] = venue_id
+                self._idx_by_id[venue_id] = len(self._ids)
+            return self._idx_by_id[venue_id]
+
+    def start_sync(self, interval: int = 5):
+        def sync():
+            while True:
+                for store in (self.venues_ids, self.venues):
+                    try:
+                        store.save_to_filesystem()
+                    except Exception as e:
+                        print(f"[red]Saving {store.filename} failed, retrying in {interval}s: {e!r}[/red]")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=sync, daemon=True)
+        thread.start()
+
+    def raw(self, venue_id: str|None, snapshot: Snapshot = None) -> FrozenDict|None:
+        venue = self.venues.get(venue_id) if venue_id is not None else None
+        if venue is None or isinstance(venue, FrozenDict):
+            return venue
+        # loaded from disk: frozen once, in place of the loaded copy
+        frozen = freeze(venue)
+        self.venues.settle(venue_id, venue, frozen)
+        return frozen
+
+    def set_venue(self, venue_id: str, venue: dict) -> VenueRecord:
+        """
+        Store a raw venue and its record, assigning its idx in the same step. The
+        venue must not be modified afterwards; readers see it once its generation
+        is published.
+        """
+        with self._write_lock:
+            venue = FrozenDict(venue, idx=self.get_venue_index(venue_id))
+            record = VenueRecord.from_raw(venue_id, venue)
+            self.venues[venue_id] = venue
+            self._staged[venue_id] = (record, venue)
+            if not self._batches or len(self._staged) >= self.publish_every:
+                self.publish()
+        return record
+
+    def publish(self):
+        """
+        Fold the staged venues into a new generation and make it current
+        """
+        with self._write_lock:
+            if not self._staged and (self._snapshot is None or len(self._ids) == len(self._snapshot.ids)):
+                return
+            staged, self._staged = self._staged, {}
+            if self._index is not None:
+                self._index.update({venue_id: record for venue_id, (record, _) in staged.items()})
+            if self._search_index is not None:
+                for venue_id, (_, venue) in staged.items():
+                    self._search_index.add(venue_id, venue)
+
+            if self._snapshot is None:
+                return  # not read yet, the first generation is built from the store
+            venues = self._snapshot.venues.updated({venue_id: record for venue_id, (record, _) in staged.items()})
+            self._snapshot = Snapshot(venues, Prefix(self._ids, len(self._ids)), self.venues.version)
+
+    @contextmanager
+    def batch(self):
+        """
+        Publish the writes made inside the block in a few generations instead
+        of one per write
+        """
+        with self._write_lock:
+            self._batches += 1
+        try:
+            yield
+        finally:
+            with self._write_lock:
+                self._batches -= 1
+                if not self._batches:
+                    self.publish()
+
+
+ROLE = os.environ.get("RAYA_ROLE", "standalone")
+SNAPSHOT_PATH = os.environ.get("RAYA_SNAPSHOT", ".cache/venues.snapshot")
+
+
+def open_cache(role: str = ROLE, path: str = SNAPSHOT_PATH) -> VenueReader:
+    """
+    The venue store of this process, by role:
+    - "standalone" (default): a GEOCache this process both crawls into and serves
+    - "writer": the same, also publishing every generation to the snapshot file at `path`
+    - "reader": a read-only SharedCache over the snapshot file a writer publishes
+    """
+    if role == "standalone":
+        return GEOCache()
+
+    from src.shared_snapshot import SharedCache, SnapshotPublisher
+    if role == "reader":
+        return SharedCache(path)
+    if role == "writer":
+        geo_cache = GEOCache()
+        SnapshotPublisher(geo_cache, path).start()
+        return geo_cache
+    raise ValueError(f"Unknown RAYA_ROLE: {role}")
 
 
-cache = GEOCache()
\ No newline at end of file
+cache = open_cache()
\ No newline at end of file
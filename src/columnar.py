@@ -0,0 +1,169 @@
+import threading
+from typing import Callable
+from src.enums import Categories, PriceTier
+from src.geo import EARTH_RADIUS_KM, KM_PER_DEG_LAT
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, VenueIndex falls back to its pure-python paths
+    np = None
+
+CATEGORY_BITS = {c: 1 << i for i, c in enumerate(c for c in Categories if c != Categories.ALL)}
+PRICE_CODES = {p: i for i, p in enumerate(PriceTier)}  # 0 (ALL) doubles as "no price"
+
+
+def default_score(rating, here_now):
+    """
+    Popularity score, written with numpy ufuncs so the same formula scores a
+    single venue or whole columns at once
+    """
+    if np is None:
+        return max(rating, 6)/2 * here_now
+    return np.maximum(rating, 6)/2 * here_now
+
+
+class VenueColumns:
+    """
+    Columnar copy of the indexed venues: one NumPy array per field (rating,
+    hereNow count, lat, lng, price tier code, category bitmask, idx), one row per
+    venue. Rows are updated in place; removed rows are flagged invalid and
+    reused. Filtering, scoring and top-k selection run as vector operations.
+    """
+    COLUMNS = {
+        "valid": "bool", "idx": "int64", "rating": "float64", "here_now": "float64",
+        "lat": "float64", "lng": "float64", "price": "int8", "categories": "uint8",
+    }
+
+    def __init__(self, score_fn: Callable = default_score, capacity: int = 1024):
+        self.score_fn = score_fn
+        self.rows: dict[str, int] = {}
+        self.ids: list[str|None] = []
+        self.free: list[int] = []
+        self.lock = threading.Lock()
+        self._allocate(capacity)
+
+    @classmethod
+    def view(cls, arrays: dict, ids, score_fn: Callable = default_score) -> "VenueColumns":
+        """
+        Read-only columns over existing arrays (e.g. memory-mapped ones), one per
+        field named as above. `top` returns `ids[row]` for the rows it selects.
+        """
+        columns = cls.__new__(cls)
+        columns.score_fn = score_fn
+        columns.rows, columns.ids, columns.free = {}, ids, []
+        columns.lock = threading.Lock()
+        for name, array in arrays.items():
+            setattr(columns, name, array)
+        return columns
+
+    def copy(self) -> "VenueColumns":
+        """
+        A copy to update while this one keeps being read
+        """
+        columns = VenueColumns.__new__(VenueColumns)
+        columns.score_fn = self.score_fn
+        columns.rows, columns.ids, columns.free = dict(self.rows), list(self.ids), list(self.free)
+        columns.lock = threading.Lock()
+        for name in self.COLUMNS:
+            setattr(columns, name, getattr(self, name).copy())
+        return columns
+
+    def _allocate(self, capacity: int):
+        old = getattr(self, "valid", None)
+        for name, dtype in self.COLUMNS.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if old is not None:
+                array[:len(old)] = getattr(self, name)
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def set(self, venue_id: str, record):
+        with self.lock:
+            row = self.rows.get(venue_id)
+            if row is None:
+                if self.free:
+                    row = self.free.pop()
+                    self.ids[row] = venue_id
+                else:
+                    row = len(self.ids)
+                    if row >= len(self.valid):
+                        self._allocate(2 * len(self.valid))
+                    self.ids.append(venue_id)
+                self.rows[venue_id] = row
+
+            for name, value in zip(self.COLUMNS, self.row_values(record)):
+                getattr(self, name)[row] = value
+
+    @staticmethod
+    def row_values(record) -> tuple:
+        """
+        The row of a record, one value per field in `COLUMNS` order
+        """
+        mask = 0
+        for category in record.category_enums:
+            mask |= CATEGORY_BITS.get(category, 0)
+        price = PRICE_CODES[record.price_tier] if record.price_tier else 0
+        return True, record.idx or 0, record.rating or 0, record.here_now, record.lat, record.lng, price, mask
+
+    def remove(self, venue_id: str):
+        with self.lock:
+            row = self.rows.pop(venue_id, None)
+            if row is None:
+                return
+            self.valid[row] = False
+            self.ids[row] = None
+            self.free.append(row)
+
+    def distances(self, lat: float, lng: float, rows):
+        lat1, lng1 = np.radians(lat), np.radians(lng)
+        lat2, lng2 = np.radians(self.lat[rows]), np.radians(self.lng[rows])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+    def top(self, n: int, category: Categories = Categories.ALL, price_tier: PriceTier = PriceTier.ALL,
+            location: tuple[float, float] = None, radius_km: float = None, ranking: str = "score",
+            distance_scale_km: float = 2) -> list[tuple[float|None, str]]:
+        """
+        (distance, venue id) of the top `n` venues, best first. Distances are None
+        without a location.
+        """
+        with self.lock:
+            size = len(self.ids)
+            mask = self.valid[:size].copy()
+            if category != Categories.ALL:
+                mask &= (self.categories[:size] & CATEGORY_BITS[category]) != 0
+            if price_tier != PriceTier.ALL:
+                mask &= self.price[:size] == PRICE_CODES[price_tier]
+            if location is not None and radius_km is not None:
+                # bounding box first, so haversine only runs on venues that can be in range
+                lat, lng = location
+                dlat = radius_km / KM_PER_DEG_LAT
+                dlng = radius_km / (KM_PER_DEG_LAT * max(np.cos(np.radians(lat)), 1e-6))
+                mask &= (np.abs(self.lat[:size] - lat) <= dlat) & (np.abs(self.lng[:size] - lng) <= dlng)
+
+            rows = np.flatnonzero(mask)
+            distance = None
+            if location is not None:
+                distance = self.distances(*location, rows)
+                if radius_km is not None:
+                    keep = distance <= radius_km
+                    rows, distance = rows[keep], distance[keep]
+
+            if ranking == "distance":
+                if distance is None:
+                    raise ValueError("Ranking by distance needs a location")
+                score = -distance
+            else:
+                score = np.asarray(self.score_fn(self.rating[rows], self.here_now[rows]), dtype=np.float64)
+                if ranking == "weighted" and distance is not None:
+                    score = score / (1 + distance / distance_scale_km)
+
+            order = np.arange(len(rows))
+            if len(rows) > n:
+                # every row tied with the n-th score stays in, so idx decides among them below
+                order = np.flatnonzero(score >= -np.partition(-score, n - 1)[n - 1])
+            # ties broken by idx, like the presorted buckets
+            order = order[np.lexsort((self.idx[rows[order]], -score[order]))][:n]
+            return [(None if distance is None else float(distance[i]), self.ids[rows[i]]) for i in order]
@@ -0,0 +1,132 @@
+import os
+import random
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from rich import print
+from typing import Callable, Iterable
+from src import metrics
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `capacity` at once
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchError(Exception):
+    """
+    A request the crawler gave up on. Raised rather than returned so memoized
+    fetches don't keep the failure around.
+    """
+
+
+class Crawler:
+    """
+    Pooled, rate-limited HTTP client for the Foursquare API.
+
+    Requests share one keep-alive session, pass through a token bucket and are
+    retried with exponential backoff and full jitter on connection errors, 429s
+    (honouring Retry-After) and 5xx responses. `map` fans work out over at most
+    `concurrency` threads.
+    """
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str = os.environ.get("FOURSQUARE_API_URL", "https://api.foursquare.com/v2"),
+                 concurrency: int = 8, rate: float = 10, burst: float = 10, max_retries: int = 5,
+                 backoff_base: float = 0.5, backoff_cap: float = 30, timeout: float = 10):
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({"accept": "application/json"})
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def get(self, path: str, params: dict = None) -> dict|None:
+        """
+        GET `path` relative to `base_url` and return the decoded JSON, or None once
+        the retries are exhausted or the API answers with a non-retryable error
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        endpoint = metrics.endpoint_of(path)
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                with metrics.foursquare_seconds.time(endpoint=endpoint):
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                metrics.foursquare_responses.inc(endpoint=endpoint, status="error")
+                if attempt == self.max_retries:
+                    break
+                metrics.foursquare_retries.inc(endpoint=endpoint, reason=e.__class__.__name__)
+                delay = self.backoff(attempt)
+                print(f"[yellow]Request to {path} failed ({e.__class__.__name__}), retrying in {delay:.1f}s[/yellow]")
+                time.sleep(delay)
+                continue
+
+            metrics.foursquare_responses.inc(endpoint=endpoint, status=response.status_code)
+            if response.status_code in self.RETRY_STATUSES:
+                if attempt == self.max_retries:
+                    break
+                metrics.foursquare_retries.inc(endpoint=endpoint, reason=response.status_code)
+                delay = self.backoff(attempt)
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                print(f"[yellow]{path} returned {response.status_code}, retrying in {delay:.1f}s[/yellow]")
+                time.sleep(delay)
+                continue
+
+            if not response.ok:
+                print(f"[red]{path} returned {response.status_code}[/red]")
+                return None
+            return response.json()
+
+        metrics.foursquare_failures.inc(endpoint=endpoint)
+        print(f"[red]Giving up on {path} after {self.max_retries + 1} attempts[/red]")
+        return None
+
+    def map(self, fn: Callable, items: Iterable) -> list:
+        """
+        Apply `fn` to every item with at most `concurrency` calls in flight. An
+        item whose call raises yields None.
+        """
+        def call(item):
+            try:
+                return fn(item)
+            except Exception as e:
+                print(f"[red]{fn.__name__}({item!r}) failed: {e!r}[/red]")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(call, items))
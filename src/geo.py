@@ -0,0 +1,143 @@
+import heapq
+import math
+from typing import Callable, Iterator
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = 111.32
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    Great-circle distance between two points in kilometers
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoGrid:
+    """
+    Uniform lat/lng grid of keys, maintained incrementally.
+
+    Radius and k-nearest queries only visit the cells around the query point,
+    so their cost depends on the local density instead of the whole city.
+    Nearest-neighbour searches give up after `max_rings` rings of cells (about
+    1100 km at the default cell size), so a point far from every key doesn't
+    scan the whole grid.
+    """
+    def __init__(self, cell_size: float = 0.02, max_rings: int = 500):
+        self.cell_size = cell_size
+        self.max_rings = max_rings
+        self.cells: dict[tuple[int, int], dict[str, tuple[float, float]]] = {}
+        self.points: dict[str, tuple[float, float]] = {}
+        # cells still shared with the grid this one was copied from
+        self._shared: set[tuple[int, int]] = set()
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, lat: float, lng: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def copy(self) -> "GeoGrid":
+        """
+        A grid sharing this one's cells until it changes them, so this one can
+        keep being read while the copy is updated
+        """
+        grid = GeoGrid(self.cell_size, self.max_rings)
+        grid.cells, grid.points = dict(self.cells), dict(self.points)
+        grid._shared = set(self.cells)
+        return grid
+
+    def _own(self, cell: tuple[int, int]) -> dict[str, tuple[float, float]]:
+        if cell in self._shared:
+            self._shared.discard(cell)
+            self.cells[cell] = dict(self.cells[cell])
+        return self.cells.setdefault(cell, {})
+
+    def add(self, key: str, lat: float, lng: float):
+        self.remove(key)
+        self.points[key] = (lat, lng)
+        self._own(self._cell(lat, lng))[key] = (lat, lng)
+
+    def remove(self, key: str):
+        point = self.points.pop(key, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        points = self._own(cell)
+        points.pop(key, None)
+        if not points:
+            del self.cells[cell]
+
+    def within(self, lat: float, lng: float, radius_km: float) -> list[tuple[float, str]]:
+        """
+        All (distance, key) pairs within `radius_km` of the point, nearest first
+        """
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlng = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        (row0, col0), (row1, col1) = self._cell(lat - dlat, lng - dlng), self._cell(lat + dlat, lng + dlng)
+
+        found = []
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                for key, (plat, plng) in self.cells.get((row, col), {}).items():
+                    distance = haversine(lat, lng, plat, plng)
+                    if distance <= radius_km:
+                        found.append((distance, key))
+        found.sort()
+        return found
+
+    def nearest(self, lat: float, lng: float, k: int, predicate: Callable[[str], bool] = None, max_km: float = None) -> list[tuple[float, str]]:
+        """
+        The `k` nearest (distance, key) pairs that satisfy `predicate`, nearest first.
+
+        Cells are visited in rings around the query cell and the search stops once
+        no unvisited ring can hold a closer point than the current k-th best.
+        """
+        if k <= 0 or not self.cells:
+            return []
+
+        row, col = self._cell(lat, lng)
+        rows = [r for r, _ in self.cells]
+        cols = [c for _, c in self.cells]
+        max_ring = min(max(abs(row - min(rows)), abs(row - max(rows)), abs(col - min(cols)), abs(col - max(cols))), self.max_rings)
+        # lower bound on the distance covered by one ring of cells
+        ring_km = 0.99 * self.cell_size * KM_PER_DEG_LAT * min(1.0, max(math.cos(math.radians(abs(lat) + self.cell_size * (max_ring + 1))), 1e-6))
+
+        best: list[tuple[float, str]] = []  # max-heap of the k best, stored negated
+        for ring in range(max_ring + 1):
+            if ring > 0:
+                reachable = (ring - 1) * ring_km
+                if max_km is not None and reachable > max_km:
+                    break
+                if len(best) == k and reachable > -best[0][0]:
+                    break
+
+            for cell in self._ring(row, col, ring):
+                for key, (plat, plng) in self.cells.get(cell, {}).items():
+                    distance = haversine(lat, lng, plat, plng)
+                    if max_km is not None and distance > max_km:
+                        continue
+                    if len(best) == k and distance >= -best[0][0]:
+                        continue
+                    if predicate and not predicate(key):
+                        continue
+                    if len(best) == k:
+                        heapq.heapreplace(best, (-distance, key))
+                    else:
+                        heapq.heappush(best, (-distance, key))
+
+        return sorted((-d, key) for d, key in best)
+
+    @staticmethod
+    def _ring(row: int, col: int, ring: int) -> Iterator[tuple[int, int]]:
+        if ring == 0:
+            yield row, col
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield row - ring, c
+            yield row + ring, c
+        for r in range(row - ring + 1, row + ring):
+            yield r, col - ring
+            yield r, col + ring
@@ -0,0 +1,94 @@
+import difflib
+import json
+import os
+import re
+import threading
+from src.geo import GeoGrid
+from src.payload import EncodedPayload
+
+STOP_WORDS = {"al", "the", "of", "and"}
+
+
+def name_tokens(name: str) -> set[str]:
+    return set(re.findall(r"\w+", name.lower())) - STOP_WORDS
+
+
+class HistoricalPlaces:
+    """
+    Historical places from a JSON file, loaded once and reloaded whenever the
+    file's mtime changes.
+
+    Each load pre-serializes the full list into an `EncodedPayload` and puts the
+    places in a `GeoGrid`, so radius queries and name lookups ("Al Masmak") don't
+    scan or re-parse the file. A place's position is its `coordinates` (lat, lng).
+    The places, grid and payload of a load are swapped in as one tuple, so a
+    reader never pairs the places of one load with the grid of another.
+    """
+    def __init__(self, filename: str = '.cache/historical_places.json'):
+        self.filename = filename
+        self.mtime: float|None = None
+        self.version = 0
+        self._loaded: tuple[list[dict], GeoGrid, EncodedPayload] = ([], GeoGrid(), EncodedPayload([]))
+        self.lock = threading.Lock()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.filename).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return
+
+        with self.lock:
+            if mtime == self.mtime:
+                return
+            places = []
+            if mtime is not None:
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    places = json.load(f)
+
+            grid = GeoGrid()
+            for i, place in enumerate(places):
+                coordinates = place.get('coordinates') or []
+                if len(coordinates) == 2:
+                    grid.add(str(i), *coordinates)
+
+            self._loaded = (places, grid, EncodedPayload(places))
+            self.mtime = mtime
+            self.version += 1
+
+    def current(self) -> tuple[list[dict], GeoGrid]:
+        self._reload()
+        places, grid, _ = self._loaded
+        return places, grid
+
+    def response(self) -> EncodedPayload:
+        """
+        The full list, serialized and compressed
+        """
+        self._reload()
+        return self._loaded[2]
+
+    def near(self, location: tuple[float, float], radius_km: float = 5, n: int = None) -> list[dict]:
+        """
+        Places within `radius_km` of `location`, nearest first, with a `distance` in kilometers
+        """
+        places, grid = self.current()
+        found = grid.within(*location, radius_km)[:n]
+        return [{**places[int(i)], "distance": round(distance, 2)} for distance, i in found]
+
+    def find(self, name: str) -> dict|None:
+        """
+        The place whose name contains every word of `name` (ignoring "al", "the"...),
+        falling back to the closest spelling
+        """
+        places, _ = self.current()
+        tokens = name_tokens(name)
+        if tokens:
+            for place in places:
+                if tokens <= name_tokens(place.get('place', '')):
+                    return place
+
+        names = {place.get('place', '').lower(): place for place in places}
+        match = difflib.get_close_matches(name.lower(), names, n=1, cutoff=0.6)
+        return names[match[0]] if match else None
@@ -1,17 +1,158 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
+import re
 import sys
+import threading
+import time
 import traceback
 
 import rich.logging
-from telebot import TeleBot
+try:
+    from telebot import TeleBot
+except ImportError:  # pyTelegramBotAPI is optional, without it notifications need a `bot` passed in
+    TeleBot = None
 from html import escape
+from src import metrics
 
 SUDO = "telegram user id"
 
+notifications = metrics.registry.counter("raya_log_notifications_total", "Telegram log notifications by outcome", ("outcome",))
+
+
+class Notifier:
+    """
+    Delivers log notifications to a Telegram chat from a background thread.
+
+    `send` only enqueues, so logging never waits on Telegram. When the bounded
+    queue is full the message is dropped and counted in `dropped`. The sender
+    collects messages for `batch_window` seconds and sends them joined into as
+    few Telegram messages as fit, at most one every `min_interval` seconds.
+    A message repeating one sent less than `dedup_window` seconds ago (same
+    text once numbers and addresses are ignored, e.g. the same traceback) is
+    held back and reported as a repeat count when the window closes.
+
+    `bot` is anything with a TeleBot-like `send_message(chat_id, text, parse_mode=...)`.
+    """
+    def __init__(self, bot, chat_id, max_queue: int = 1000, batch_window: float = 2.0, dedup_window: float = 60.0,
+                 min_interval: float = 1.0, max_length: int = 4000):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.batch_window = batch_window
+        self.dedup_window = dedup_window
+        self.min_interval = min_interval
+        self.max_length = max_length
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        # dedup key -> [time first sent, repeats held back, message]
+        self.recent: dict[str, list] = {}
+        self._last_send = 0.0
+        self._thread: threading.Thread|None = None
+        self._lock = threading.Lock()
+
+    def send(self, message: str) -> bool:
+        if self._thread is None:
+            self._start()
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            notifications.inc(outcome="dropped")
+            return False
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+                self._thread.start()
+                # give pending messages (e.g. a crash report) a chance to go out on exit
+                atexit.register(self.flush, 5)
+
+    def flush(self, timeout: float = 10) -> bool:
+        """
+        Wait until every queued message has been handled
+        """
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    @staticmethod
+    def dedup_key(message: str) -> str:
+        return re.sub(r"0x[0-9a-fA-F]+|\d+", "#", message)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.dedup_window)]
+            except queue.Empty:
+                batch = []
+            deadline = time.monotonic() + self.batch_window
+            while batch and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._deliver(self._coalesce(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _coalesce(self, batch: list[str]) -> list[str]:
+        now = time.monotonic()
+        messages = []
+        for key, (first, repeats, message) in list(self.recent.items()):
+            if now - first >= self.dedup_window:
+                del self.recent[key]
+                if repeats:
+                    messages.append(f"[repeated {repeats} more times] {message.splitlines()[-1][:200]}")
+
+        for message in batch:
+            key = self.dedup_key(message)
+            entry = self.recent.get(key)
+            if entry is not None:
+                entry[1] += 1
+                self.coalesced += 1
+                notifications.inc(outcome="coalesced")
+                continue
+            self.recent[key] = [now, 0, message]
+            messages.append(message)
+        return messages
+
+    def _deliver(self, messages: list[str]):
+        chunks, chunk = [], ""
+        for message in messages:
+            message = escape(message)[:self.max_length]
+            if chunk and len(chunk) + len(message) + 2 > self.max_length:
+                chunks.append(chunk)
+                chunk = ""
+            chunk = f"{chunk}\n\n{message}" if chunk else message
+
+        for text in chunks + ([chunk] if chunk else []):
+            wait = self._last_send + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_send = time.monotonic()
+            try:
+                self.bot.send_message(self.chat_id, f"<pre>{text}</pre>", parse_mode="HTML")
+                self.sent += 1
+                notifications.inc(outcome="sent")
+            except Exception:
+                self.failed += 1
+                notifications.inc(outcome="failed")
+
 class Logger(logging.Logger):
-    def __init__(self, logging_service, level=logging.INFO, max_size=int(3e6), bot: TeleBot = None, set_exception_hook=True):
+    def __init__(self, logging_service, level=logging.INFO, max_size=int(3e6), bot: "TeleBot" = None, set_exception_hook=True):
         self.logger = logging.getLogger(f"{logging_service}_logger")
         self.logger.setLevel(logging.DEBUG)
         self.logger.propagate = False
@@ -38,7 +179,10 @@ class Logger(logging.Logger):
         self.logger.addHandler(sh)
 
 
-        self.bot = bot or TeleBot(os.environ.get("DEBUG_BOT_TOKEN"))
+        # without a bot or a DEBUG_BOT_TOKEN, notifications are only logged
+        token = os.environ.get("DEBUG_BOT_TOKEN")
+        self.bot = bot or (TeleBot(token) if token and TeleBot else None)
+        self.notifier = Notifier(self.bot, SUDO)
 
         # error handler
         if set_exception_hook:
@@ -49,10 +193,7 @@ class Logger(logging.Logger):
         self.logger.log(level, message, stacklevel=stacklevel, **kwargs)
 
         if notification and self.bot:
-            try:
-                self.bot.send_message(SUDO, f"<pre>{escape(message)[:4030]}</pre>", parse_mode="HTML")
-            except:
-                pass
+            self.notifier.send(message)
 
     def info(self, message, notification=False, **kwargs):
         self._log(message, logging.INFO, notification, **kwargs)
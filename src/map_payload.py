@@ -0,0 +1,136 @@
+import math
+import threading
+from cachetools import LRUCache
+from src.payload import EncodedPayload
+from src.records import VenueRecord
+from src.venue_index import popularity_score
+
+
+def map_venue(venue_id: str, record: VenueRecord) -> dict|None:
+    """
+    The part of a venue the map draws: position, popup fields, the first photo
+    and the category icons. None if the venue has no position.
+    """
+    if record.lat is None or record.lng is None:
+        return None
+
+    venue = {
+        "id": venue_id,
+        "idx": record.idx,
+        "name": record.name,
+        "location": {"lat": record.lat, "lng": record.lng},
+        "rating": record.rating,
+        "price": dict(zip(("tier", "message", "currency"), record.price)) if record.price else None,
+        "hereNow": {"count": record.here_now},
+        "categories": [
+            {"name": name, "icon": {"prefix": icon[0], "suffix": icon[1]} if icon else None}
+            for name, icon in zip(record.categories, record.icons)
+        ],
+        "categoryEnum": record.category_enums[0].value if record.category_enums else None,
+    }
+    if record.photo:
+        venue['photos'] = {"groups": [{"items": [{"prefix": record.photo[0], "suffix": record.photo[1]}]}]}
+    return venue
+
+
+class MapPayload:
+    """
+    Precomputed /api/trending-venues responses.
+
+    The venues are projected with `map_venue` and ordered by popularity once per
+    data version. Every distinct query (bounding box, zoom, page) is rendered
+    into an `EncodedPayload` once and kept in an LRU until the version moves on.
+
+    Below `full_zoom`, venues are thinned to the `per_cell` most popular ones in
+    each grid cell, with `cells_per_tile` cells across a map tile at that zoom.
+    """
+    def __init__(self, cache, per_cell: int = 1, cells_per_tile: int = 8, full_zoom: int = 14,
+                 page_size: int = 500, max_page_size: int = 5000, maxsize: int = 256):
+        self.cache = cache
+        self.per_cell = per_cell
+        self.cells_per_tile = cells_per_tile
+        self.full_zoom = full_zoom
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.version = None
+        self.records: list[dict] = []
+        self.responses: LRUCache = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        snapshot = self.cache.snapshot
+        if snapshot.version == self.version:
+            return
+        ranked = []
+        for venue_id, record in snapshot.venues.items():
+            venue = map_venue(venue_id, record)
+            if venue is not None:
+                ranked.append((-popularity_score(record), record.idx or 0, venue))
+        ranked.sort(key=lambda x: x[:2])
+        self.records = [record for _, _, record in ranked]
+        self.responses.clear()
+        self.version = snapshot.version
+
+    @staticmethod
+    def normalize_bbox(bbox: tuple[float, float, float, float]|None) -> tuple|None:
+        """
+        Round a (south, west, north, east) box outwards to ~100m, so nearby
+        viewports share a cached response
+        """
+        if bbox is None:
+            return None
+        south, west, north, east = bbox
+        return (math.floor(south * 1000) / 1000, math.floor(west * 1000) / 1000,
+                math.ceil(north * 1000) / 1000, math.ceil(east * 1000) / 1000)
+
+    def query(self, bbox: tuple[float, float, float, float] = None, zoom: int = None,
+              page: int = None, page_size: int = None) -> EncodedPayload:
+        """
+        Venues inside `bbox`, thinned for `zoom`, most popular first. Without a
+        `page` every matching venue is returned; pages start at 1.
+        """
+        bbox = self.normalize_bbox(bbox)
+        if zoom is not None and zoom >= self.full_zoom:
+            zoom = None
+        if page is not None:
+            page_size = min(page_size or self.page_size, self.max_page_size)
+        else:
+            page_size = None
+        key = (bbox, zoom, page, page_size)
+
+        with self.lock:
+            self._refresh()
+            payload = self.responses.get(key)
+            if payload is not None:
+                return payload
+            records = self.records
+
+        venues = self._filter(records, bbox, zoom)
+        total = len(venues)
+        if page is not None:
+            venues = venues[(page - 1) * page_size:page * page_size]
+        payload = EncodedPayload(venues, {"X-Total-Count": str(total)})
+
+        with self.lock:
+            # a newer version may have been loaded while rendering
+            if records is self.records:
+                self.responses[key] = payload
+        return payload
+
+    def _filter(self, records: list[dict], bbox: tuple|None, zoom: int|None) -> list[dict]:
+        if bbox is None and zoom is None:
+            return records
+        cell = 360 / 2 ** zoom / self.cells_per_tile if zoom is not None else None
+        counts: dict[tuple[int, int], int] = {}
+        venues = []
+        for record in records:
+            lat, lng = record['location']['lat'], record['location']['lng']
+            if bbox is not None and not (bbox[0] <= lat <= bbox[2] and bbox[1] <= lng <= bbox[3]):
+                continue
+            if cell is not None:
+                key = (math.floor(lat / cell), math.floor(lng / cell))
+                if counts.get(key, 0) >= self.per_cell:
+                    continue
+                counts[key] = counts.get(key, 0) + 1
+            venues.append(record)
+        return venues
@@ -0,0 +1,217 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable
+
+# latency buckets in seconds, from a dict lookup to a slow LLM answer
+DEFAULT_BUCKETS = (0.00001, 0.0001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, registry: "Registry", name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        registry.metrics.append(self)
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return super().render() + [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in values]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        # per label set: [count per bucket (+Inf last), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self.key(labels)
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def time(self, **labels) -> "Timer":
+        return Timer(self, labels)
+
+    def render(self) -> list[str]:
+        with self.lock:
+            values = [(k, list(counts), total) for k, (counts, total) in self.values.items()]
+        lines = super().render()
+        names = self.labelnames + ("le",)
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Timer:
+    """
+    Context manager observing the seconds spent in its block
+    """
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """
+    Counters and histograms rendered in the Prometheus text format, plus
+    collectors that read hit/miss counts off existing caches at scrape time.
+
+    Disabled (RAYA_METRICS=0), recording is a single flag check and `timed`
+    returns the function undecorated.
+    """
+    def __init__(self, enabled: bool = os.environ.get("RAYA_METRICS", "1") != "0"):
+        self.enabled = enabled
+        self.metrics: list[Metric] = []
+        self.caches: dict[str, Callable[[], tuple[int, int, int]]] = {}
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return Counter(self, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return Histogram(self, name, help, labelnames, buckets=buckets)
+
+    def timed(self, histogram: Histogram, **labels) -> Callable:
+        """
+        Decorator observing every call's duration in `histogram`
+        """
+        def decorator(fn: Callable) -> Callable:
+            if not self.enabled:
+                return fn
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def register_cache(self, name: str, stats: Callable[[], tuple[int, int, int]]):
+        """
+        Export a cache's (hits, misses, entries), read when /metrics is scraped
+        """
+        self.caches[name] = stats
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+
+        stats = {}
+        for name, collect in list(self.caches.items()):
+            try:
+                stats[name] = collect()
+            except Exception:
+                continue
+        for metric, i, kind, help in [
+            ("raya_cache_hits_total", 0, "counter", "Cache lookups answered from the cache"),
+            ("raya_cache_misses_total", 1, "counter", "Cache lookups that had to compute the value"),
+            ("raya_cache_entries", 2, "gauge", "Entries currently held by the cache"),
+        ]:
+            lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+            lines += [f"{metric}{_labels(('cache',), (name,))} {values[i]}" for name, values in stats.items()]
+        return "\n".join(lines) + "\n"
+
+
+def cache_info_stats(fn: Callable) -> Callable[[], tuple[int, int, int]]:
+    """
+    Stats collector for a function memoized with cachetools' `cached(..., info=True)`
+    """
+    def stats():
+        info = fn.cache_info()
+        return info.hits, info.misses, info.currsize
+    return stats
+
+
+def endpoint_of(path: str) -> str:
+    """
+    Foursquare path with venue ids collapsed, to keep label cardinality bounded
+    """
+    return re.sub(r"/[0-9a-f]{24}(?=/|$)", "/:id", "/" + path.lstrip("/"))
+
+
+registry = Registry()
+
+foursquare_seconds = registry.histogram("raya_foursquare_request_seconds", "Foursquare API request latency, per attempt", ("endpoint",))
+foursquare_responses = registry.counter("raya_foursquare_responses_total", "Foursquare API responses by status code (error for connection failures)", ("endpoint", "status"))
+foursquare_retries = registry.counter("raya_foursquare_retries_total", "Foursquare API requests retried", ("endpoint", "reason"))
+foursquare_failures = registry.counter("raya_foursquare_failures_total", "Foursquare API requests given up on", ("endpoint",))
+
+llm_seconds = registry.histogram("raya_llm_call_seconds", "LLM call latency", ("mode",))
+llm_calls = registry.counter("raya_llm_calls_total", "LLM calls by outcome", ("mode", "outcome"))
+llm_tokens = registry.counter("raya_llm_tokens_total", "LLM tokens reported by the provider", ("kind",))
+tool_seconds = registry.histogram("raya_tool_call_seconds", "LLM tool invocation latency", ("tool",))
+tool_calls = registry.counter("raya_tool_calls_total", "LLM tool invocations by outcome", ("tool", "outcome"))
+
+cache_query_seconds = registry.histogram("raya_cache_query_seconds", "Venue cache query latency", ("method",))
+flush_seconds = registry.histogram("raya_cache_flush_seconds", "Cache persistence flush latency", ("cache",))
+flushed_keys = registry.counter("raya_cache_flushed_keys_total", "Cache entries written by persistence flushes", ("cache",))
+
+single_flight_collapsed = registry.counter("raya_single_flight_collapsed_total", "Calls served by an identical call already in flight", ("call",))
@@ -0,0 +1,46 @@
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+class EncodedPayload:
+    """
+    JSON response body serialized and compressed once, together with its ETag,
+    so serving it again is only a matter of picking the right bytes.
+
+    Bodies smaller than `min_size` are not compressed. Each encoding gets its own
+    ETag (the identity tag plus the encoding name).
+    """
+    __slots__ = ("body", "encodings", "etag", "headers")
+
+    def __init__(self, data, headers: dict = None, min_size: int = 1024):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        self.headers = headers or {}
+        self.encodings: dict[str, bytes] = {}
+        if len(self.body) >= min_size:
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(self.body, quality=9)
+            self.encodings['gzip'] = gzip.compress(self.body, compresslevel=9, mtime=0)
+
+    def __len__(self):
+        return len(self.body)
+
+    def etags(self) -> list[str]:
+        return [self.etag] + [f"{self.etag}-{encoding}" for encoding in self.encodings]
+
+    def negotiate(self, accept_encodings) -> tuple[str|None, bytes, str]:
+        """
+        (content encoding, body, etag) for the best encoding the client accepts.
+        `accept_encodings` maps an encoding name to its quality, like werkzeug's
+        `request.accept_encodings`.
+        """
+        for encoding, body in self.encodings.items():
+            if accept_encodings[encoding]:
+                return encoding, body, f"{self.etag}-{encoding}"
+        return None, self.body, self.etag
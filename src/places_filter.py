@@ -1,40 +1,81 @@
+import os
+import re
+import json
 from src.enums import Categories
 
-ALLOWED_CATEGORIES = { 
-    "Juice Bar",
-    "Lebanese Restaurant",
-    "Event Space",
-    "Gym and Studio",
-    "Steakhouse",
-    "Airport Lounge",
-    "Coffee Roaster",
-    "National Park",
-    "Shopping Mall",
-    "Restaurant",
-    "Business Center",
-    "Bakery",
-    "Pizzeria",
-    "Food Court",
-    "Hookah Bar",
-    "American Restaurant",
-    "Tea Room",
-    "French Restaurant",
-    "Hiking Trail",
-    "Burger Joint",
-    "Festival",
-    "Cafe, Coffee, and Tea House",
-    "Coffee Shop",
-    "Breakfast Spot",
-    "Italian Restaurant",
-    "City",
-    "Swiss Restaurant",
-    "Golf Course",
-    "Plaza",
-    "Shopping Plaza",
-    "International Airport",
-    "Village",
-    "Café"
-}
+RULES_FILE = os.environ.get("RAYA_CATEGORY_RULES", os.path.join(os.path.dirname(__file__), "category_rules.json"))
+
+
+class CategoryClassifier:
+    """
+    Category rules compiled once into regular expressions, with a memo per
+    category string (Foursquare only has a few hundred distinct names; the
+    memos are reset if they ever outgrow `memo_size`).
+
+    Matching keeps the semantics of the original keyword scans: a keyword
+    matches anywhere in the lowercased name, and when keywords of several
+    categories match, the category listed first in the rules wins.
+    """
+    def __init__(self, allowed_categories: set[str], allowed_keywords: list[str], category_keywords: dict[Categories, list[str]], memo_size: int = 10000):
+        self.memo_size = memo_size
+        self.allowed_categories = allowed_categories
+        self.allowed_keywords = allowed_keywords
+        self.category_keywords = category_keywords
+
+        self.allowed_pattern = self._compile(allowed_keywords)
+        self.keyword_category = {}
+        for category, keywords in category_keywords.items():
+            for keyword in keywords:
+                self.keyword_category.setdefault(keyword, category)
+        # a lookahead finds a match at every position, the alternation order
+        # makes the earliest listed category win at each one
+        self.category_pattern = re.compile("(?=(" + "|".join(re.escape(k) for k in self.keyword_category) + "))")
+        self.precedence = {category: i for i, category in enumerate(category_keywords)}
+
+        self._allowed_memo: dict[str, bool] = {}
+        self._category_memo: dict[str, Categories] = {}
+
+    @staticmethod
+    def _compile(keywords: list[str]) -> re.Pattern:
+        return re.compile("|".join(re.escape(k) for k in keywords))
+
+    @classmethod
+    def from_file(cls, path: str = RULES_FILE) -> "CategoryClassifier":
+        with open(path, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+        return cls(
+            set(rules["allowed_categories"]),
+            rules["allowed_keywords"],
+            {Categories(r["category"]): r["keywords"] for r in rules["category_keywords"]},
+        )
+
+    def is_allowed(self, category: str) -> bool:
+        allowed = self._allowed_memo.get(category)
+        if allowed is None:
+            allowed = category in self.allowed_categories or self.allowed_pattern.search(category.lower()) is not None
+            if len(self._allowed_memo) >= self.memo_size:
+                self._allowed_memo.clear()
+            self._allowed_memo[category] = allowed
+        return allowed
+
+    def classify(self, category: str) -> Categories:
+        result = self._category_memo.get(category)
+        if result is None:
+            matches = {self.keyword_category[m] for m in self.category_pattern.findall(category.lower())}
+            result = min(matches, key=self.precedence.get) if matches else Categories.ALL
+            if len(self._category_memo) >= self.memo_size:
+                self._category_memo.clear()
+            self._category_memo[category] = result
+        return result
+
+
+classifier = CategoryClassifier.from_file()
+
+ALLOWED_CATEGORIES = classifier.allowed_categories
+
+# keyword tables for classify_category, checked in this order
+CATEGORY_KEYWORDS = classifier.category_keywords
+
 
 def is_allowed_category(category: str) -> bool:
     """
@@ -46,11 +87,7 @@ def is_allowed_category(category: str) -> bool:
     Returns:
         bool: True if the category is allowed, False otherwise
     """
-
-    parital_filter_keywords = ["plaza", "mall", "cafe", "café", "coffee", "tea", "restaurant", "pub", "bar", "club", "lounge", "tea"]
-    partial_filter = any(keyword in category.lower() for keyword in parital_filter_keywords)
-
-    return category in ALLOWED_CATEGORIES or partial_filter
+    return classifier.is_allowed(category)
 
 def filter_venues(venues: list) -> list:
     """
@@ -92,47 +129,4 @@ def classify_category(category: str) -> Categories:
     Returns:
         Categories: The corresponding Categories enum value
     """
-    category = category.lower()
-    
-    # Cafe related keywords
-    if any(keyword in category for keyword in [
-        'cafe', 'café', 'coffee', 'tea', 'bakery'
-    ]):
-        return Categories.CAFE
-    
-    # Restaurant related keywords
-    if any(keyword in category for keyword in [
-        'restaurant', 'food', 'pizzeria', 'steakhouse',
-        'burger', 'breakfast', 'juice bar', 'hookah',
-        'dining'
-    ]):
-        return Categories.RESTAURANT
-    
-    # Lounge related keywords
-    if any(keyword in category for keyword in [
-        'lounge', 'bar'
-    ]):
-        return Categories.LOUNGE
-    
-    # Shopping related keywords
-    if any(keyword in category for keyword in [
-        'shop', 'mall', 'plaza', 'store', 'business center'
-    ]):
-        return Categories.SHOPPING
-    
-    # Hotel related keywords
-    if any(keyword in category for keyword in [
-        'hotel', 'resort', 'inn', 'accommodation'
-    ]):
-        return Categories.HOTEL
-    
-    # Event and attraction related keywords
-    if any(keyword in category for keyword in [
-        'event', 'festival', 'historic', 'park', 'trail',
-        'cemetery', 'gym', 'studio', 'golf', 'airport',
-        'terminal', 'hospital', 'neighborhood', 'city',
-        'village'
-    ]):
-        return Categories.EVENT
-    
-    return Categories.ALL
+    return classifier.classify(category)
@@ -0,0 +1,122 @@
+import sys
+from src.enums import Categories, PriceTier
+from src.places_filter import classify_category, is_allowed_category
+
+# one copy of every distinct small tuple (category names, icons, prices), shared by the records using it
+_shared: dict[tuple, tuple] = {}
+
+
+def shared(value: tuple) -> tuple:
+    return _shared.setdefault(value, value)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class VenueRecord:
+    """
+    Compact form of a raw Foursquare venue: the fields the queries, the map and
+    the refresh scheduler use, normalized once at ingest. Category names, icon
+    prefixes and price messages are interned and equal tuples are stored once, so
+    a record costs a few hundred bytes instead of the raw venue's tens of KB.
+
+    Records are never modified once built; an update builds a new one.
+    """
+    __slots__ = (
+        "id", "idx", "name", "lat", "lng", "address", "categories", "category_enums", "icons", "allowed",
+        "price", "price_tier", "rating", "here_now", "likes", "hours", "photo", "fetched_at",
+    )
+
+    @classmethod
+    def from_raw(cls, venue_id: str, venue: dict) -> "VenueRecord":
+        record = cls.__new__(cls)
+        location = venue.get('location') or {}
+        categories = [c if isinstance(c, dict) else {"name": c} for c in venue.get('categories', [])]
+        names = [c.get('name') for c in categories if c.get('name')]
+        icons = [c.get('icon') or {} for c in categories if c.get('name')]
+        price = venue.get('price') or {}
+        photo = next((g['items'][0] for g in (venue.get('photos') or {}).get('groups', []) if g.get('items')), None)
+
+        record.id = venue_id
+        record.idx = venue.get('idx')
+        record.name = venue.get('name')
+        record.lat = float(location['lat']) if location.get('lat') is not None else None
+        record.lng = float(location['lng']) if location.get('lng') is not None else None
+        record.address = tuple(location.get('formattedAddress') or ())
+        record.categories = shared(tuple(sys.intern(n) for n in names))
+        record.category_enums = shared(tuple(classify_category(n) for n in names))
+        record.icons = shared(tuple((_intern(i.get('prefix')), _intern(i.get('suffix'))) if i else None for i in icons))
+        record.allowed = any(is_allowed_category(n) for n in names)
+        record.price = shared((price.get('tier'), _intern(price.get('message')), _intern(price.get('currency')))) if price else None
+        try:
+            record.price_tier = PriceTier(price.get('message'))
+        except ValueError:
+            record.price_tier = None
+        record.rating = venue.get('rating')
+        record.here_now = (venue.get('hereNow') or {}).get('count', 0)
+        record.likes = (venue.get('likes') or {}).get('count', 0)
+        record.hours = (venue.get('hours') or {}).get('status')
+        record.photo = (_intern(photo.get('prefix')), photo.get('suffix')) if photo else None
+        record.fetched_at = venue.get('fetchedAt')
+        return record
+
+    @property
+    def indexable(self) -> bool:
+        """
+        In an allowed category and placed on the map
+        """
+        return self.allowed and self.lat is not None and self.lng is not None
+
+    def export(self) -> dict:
+        """
+        The record as the venue dict queries return
+        """
+        venue = {
+            "idx": self.idx,
+            "name": self.name,
+            "location": {"lat": self.lat, "lng": self.lng, "address": list(self.address)},
+            "categories": list(self.categories),
+            "categoryEnum": list(self.category_enums),
+            "hereNow": {"count": self.here_now},
+            "likes": {"count": self.likes},
+        }
+        if self.rating is not None:
+            venue['rating'] = self.rating
+        if self.price:
+            venue['price'] = dict(zip(("tier", "message", "currency"), self.price))
+        if self.hours:
+            venue['hours'] = {"status": self.hours}
+        return venue
+
+    def pack(self) -> list:
+        """
+        The fields as a JSON-serializable list, see `unpack`
+        """
+        values = []
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if name == "category_enums":
+                value = [c.value for c in value]
+            elif name == "price_tier":
+                value = value.value if value else None
+            values.append(value)
+        return values
+
+    @classmethod
+    def unpack(cls, values: list) -> "VenueRecord":
+        record = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, values):
+            if name == "category_enums":
+                value = shared(tuple(Categories(c) for c in value))
+            elif name == "price_tier":
+                value = PriceTier(value) if value else None
+            elif name in ("categories", "icons", "price") and value is not None:
+                value = shared(tuple(tuple(map(_intern, v)) if isinstance(v, list) else _intern(v) for v in value))
+            elif name in ("address", "photo") and value is not None:
+                value = tuple(value)
+            setattr(record, name, value)
+        return record
+
+    def __repr__(self):
+        return f"VenueRecord(idx={self.idx}, id={self.id!r}, name={self.name!r})"
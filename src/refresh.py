@@ -0,0 +1,47 @@
+import time
+from src.records import VenueRecord
+
+
+class RefreshScheduler:
+    """
+    Decides which cached venues (`VenueRecord`s) to re-fetch in a refresh cycle.
+
+    A venue's staleness is its age over `ttl`. Its priority is the staleness
+    boosted by its popularity rank, so the top venues come due earlier (the
+    very top one at `ttl / (1 + rank_boost)`) while the tail waits for the full
+    TTL. Each cycle re-fetches at most `budget` due venues, highest priority first.
+    Venues without a fetch time are always due.
+    """
+    def __init__(self, ttl: float = 60*60*6, budget: int = 100, rank_boost: float = 2):
+        self.ttl = ttl
+        self.budget = budget
+        self.rank_boost = rank_boost
+
+    def age(self, venue: VenueRecord, now: float = None) -> float:
+        fetched_at = venue.fetched_at
+        if fetched_at is None:
+            return float('inf')
+        return (now or time.time()) - fetched_at
+
+    def is_stale(self, venue: VenueRecord, now: float = None) -> bool:
+        return self.age(venue, now) >= self.ttl
+
+    def priority(self, venue: VenueRecord, rank: int|None, total: int, now: float = None) -> float:
+        staleness = self.age(venue, now) / self.ttl
+        if rank is None or not total:
+            return staleness
+        return staleness * (1 + self.rank_boost * (1 - rank / total))
+
+    def plan(self, venues: dict[str, VenueRecord], ranked_ids: list[str], now: float = None) -> list[str]:
+        """
+        Ids of the venues to re-fetch this cycle, most urgent first
+        """
+        now = now or time.time()
+        ranks = {venue_id: rank for rank, venue_id in enumerate(ranked_ids)}
+        due = []
+        for venue_id, venue in venues.items():
+            priority = self.priority(venue, ranks.get(venue_id), len(ranked_ids), now)
+            if priority >= 1:
+                due.append((priority, -ranks.get(venue_id, len(ranks)), venue_id))
+        due.sort(reverse=True)
+        return [venue_id for _, _, venue_id in due[:self.budget]]
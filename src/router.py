@@ -0,0 +1,159 @@
+import re
+import threading
+from src.enums import Categories, PriceTier
+from src.places_filter import CATEGORY_KEYWORDS, classify_category
+from src.tool_cache import compact_venue
+
+INTENT_WORDS = {"top", "best", "recommend", "recommendation", "recommendations", "suggest", "suggestions",
+                "good", "great", "popular", "nice", "show", "find", "list", "give"}
+GENERIC_WORDS = {"place", "places", "spot", "spots", "venue", "venues"}
+NEAR_WORDS = {"near", "nearby", "around", "close", "closest", "nearest"}
+PRICE_WORDS = {
+    "very expensive": PriceTier.VERY_EXPENSIVE, "luxury": PriceTier.VERY_EXPENSIVE, "luxurious": PriceTier.VERY_EXPENSIVE,
+    "expensive": PriceTier.EXPENSIVE, "pricey": PriceTier.EXPENSIVE, "upscale": PriceTier.EXPENSIVE, "fancy": PriceTier.EXPENSIVE,
+    "moderate": PriceTier.MODERATE, "moderately": PriceTier.MODERATE, "mid-range": PriceTier.MODERATE,
+    "cheap": PriceTier.CHEAP, "affordable": PriceTier.CHEAP, "budget": PriceTier.CHEAP, "inexpensive": PriceTier.CHEAP,
+}
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+FILLER_WORDS = {"the", "a", "an", "some", "any", "me", "i", "to", "in", "of", "for", "and", "please", "can", "you",
+                "want", "need", "looking", "go", "visit", "riyadh", "here", "what", "are", "is", "where", "priced", "options"}
+# anything asking about a specific venue, or qualifying the list beyond category/price/location, goes to the LLM
+BLOCK_WORDS = {"why", "how", "history", "open", "hours", "when", "menu", "rating", "ratings", "review", "reviews",
+               "tips", "compare", "vs", "about", "tell", "directions", "far", "book", "reservation", "not", "don't",
+               "without", "except", "but", "than", "or", "idx"}
+
+CATEGORY_LABELS = {
+    Categories.ALL: "venues",
+    Categories.CAFE: "cafes",
+    Categories.RESTAURANT: "restaurants",
+    Categories.LOUNGE: "lounges",
+    Categories.EVENT: "events and attractions",
+    Categories.HOTEL: "hotels",
+    Categories.SHOPPING: "shopping places",
+}
+
+
+def _category_words() -> dict[str, Categories]:
+    words = {}
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for keyword in keywords + [category.value]:
+            for form in (keyword, keyword + "s", keyword + "es"):
+                words.setdefault(form, category)
+    words["shopping"] = Categories.SHOPPING
+    return words
+
+
+class FastPathRouter:
+    """
+    Answers plain "top N <category> [near me] [cheap]" requests straight from the
+    venue index, without an LLM round trip.
+
+    A message is only answered when every word is understood (intent, category,
+    price, count, nearness or filler words), it names a single category or asks
+    for places in general, and it has no word that needs the LLM. Everything else
+    returns None and should go to the chatbot graph. `hits` and `misses` count both
+    outcomes.
+    """
+    def __init__(self, cache, location: tuple[float, float] = None, min_coverage: float = 1.0):
+        self.cache = cache
+        self.location = location
+        self.min_coverage = min_coverage
+        self.category_words = _category_words()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def parse(self, message: str) -> dict|None:
+        """
+        Extract the get_top_venues arguments from a message, or None if the
+        message is not confidently a top-venues request
+        """
+        text = message.lower()
+        price_tier = PriceTier.ALL
+        for phrase, tier in PRICE_WORDS.items():
+            if re.search(rf"\b{re.escape(phrase)}\b", text):
+                price_tier = tier
+                text = re.sub(rf"\b{re.escape(phrase)}\b", " ", text)
+                break
+
+        tokens = re.findall(r"[\w'-]+", text)
+        if not tokens:
+            return None
+
+        n, near, intent, known = 5, False, False, 0
+        category_tokens: list[tuple[int, str]] = []
+        generic = False
+        for i, token in enumerate(tokens):
+            if token in BLOCK_WORDS:
+                return None
+            if token in self.category_words:
+                category_tokens.append((i, token))
+            elif token in GENERIC_WORDS:
+                generic = True
+            elif token in INTENT_WORDS:
+                intent = True
+            elif token in NEAR_WORDS:
+                near = True
+            elif token.isdigit() and 0 < int(token) <= 20:
+                n = int(token)
+            elif token in NUMBER_WORDS:
+                n = NUMBER_WORDS[token]
+            elif token not in FILLER_WORDS:
+                continue
+            known += 1
+        known += len(category_tokens)
+
+        if not intent or known / len(tokens) < self.min_coverage:
+            return None
+
+        if category_tokens:
+            positions = [i for i, _ in category_tokens]
+            if positions != list(range(positions[0], positions[0] + len(positions))):
+                return None  # several separate categories, e.g. "cafes and hotels"
+            category = classify_category(" ".join(t for _, t in category_tokens))
+            if category == Categories.ALL:
+                return None
+        elif generic:
+            category = Categories.ALL
+        else:
+            return None
+
+        return {"n": n, "category": category, "price_tier": price_tier, "near": near}
+
+    def route(self, message: str, location: tuple[float, float] = None) -> str|None:
+        """
+        Templated answer for a fast-path message, or None to fall back to the LLM.
+        "Near me" is `location`, by default the router's own.
+        """
+        query = self.parse(message)
+        venues = []
+        if query:
+            location = (location or self.location) if query["near"] else None
+            venues = self.cache.get_top_venues(query["n"], location, query["category"], query["price_tier"], ranking="weighted" if location else "score")
+
+        with self.lock:
+            if not venues:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self.render(query, [compact_venue(v) for v in venues])
+
+    @staticmethod
+    def render(query: dict, venues: list[dict]) -> str:
+        label = CATEGORY_LABELS[query["category"]]
+        if query["price_tier"] != PriceTier.ALL:
+            label = f"{query['price_tier'].value.lower()} {label}"
+        where = "near you" if query["near"] else "in Riyadh"
+
+        lines = [f"The top {label} {where} are:"]
+        for i, venue in enumerate(venues, start=1):
+            details = [f"rating {venue['rating']}" if venue.get('rating') else None, venue.get('price'),
+                       f"{venue['distance']} km away" if venue.get('distance') is not None else None]
+            details = ", ".join(d for d in details if d)
+            lines.append(f"{i}. {venue['name']} {{idx: {venue['idx']}}}" + (f" ({details})" if details else ""))
+        return "\n".join(lines)
@@ -0,0 +1,160 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+# NFKD splits hamza/madda off alef, waw and yaa and accents off latin letters,
+# the marks are then dropped along with harakat; these are the rest
+ARABIC_LETTERS = str.maketrans({"ٱ": "ا", "ى": "ي", "ة": "ه", "ـ": None})
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "with", "is", "it", "this", "that", "was",
+    "are", "be", "i", "you", "we", "they", "my", "me", "so", "very", "but", "not", "place", "places",
+    "في", "من", "علي", "الي", "عن", "مع", "و", "او", "هذا", "هذه", "هو", "هي", "ما", "لا", "كان", "جدا", "المكان", "مكان",
+}
+# fields of a raw venue and how much a match in each counts
+FIELD_WEIGHTS = {"name": 3, "category": 2, "phrase": 2, "tip": 1, "list": 1}
+
+
+def normalize(text: str) -> str:
+    text = "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+    text = text.translate(ARABIC_LETTERS)
+    return re.sub(r"(?<=\w)-(?=\w)", "", text)  # wi-fi -> wifi
+
+
+def stem(token: str) -> str:
+    if token.startswith("ال") and len(token) > 4:
+        return token[2:]  # Arabic definite article
+    if token.isascii() and len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]  # English plural
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased, normalized (accents, harakat, hamza and alef/yaa/taa marbuta forms)
+    and lightly stemmed words of an Arabic or English text, stop words removed
+    """
+    return [stem(t) for t in re.findall(r"\w+", normalize(text)) if t not in STOP_WORDS and not t.isdigit()]
+
+
+def venue_texts(venue: dict) -> list[tuple[str, str]]:
+    """
+    (field, text) pairs of the searchable text of a raw venue: its name and
+    categories, phrases, tips and the lists it appears in
+    """
+    texts = [("name", venue.get('name') or "")]
+    texts += [("category", c['name'] if isinstance(c, dict) else c) for c in venue.get('categories', [])]
+    for phrase in venue.get('phrases', []):
+        texts.append(("phrase", phrase.get('sample', {}).get('text') or phrase.get('phrase', "")))
+    for group in venue.get('tips', {}).get('groups', []):
+        texts += [("tip", item.get('text', "")) for item in group.get('items', [])]
+    for group in venue.get('listed', {}).get('groups', []):
+        texts += [("list", f"{item.get('name', '')} {item.get('description', '')}") for item in group.get('items', [])]
+    return [(field, text) for field, text in texts if text and text.strip()]
+
+
+class SearchIndex:
+    """
+    BM25 inverted index over venue text, maintained incrementally.
+
+    A venue is one document; a term's frequency is its field-weighted count
+    (`FIELD_WEIGHTS`), so a match in the name outweighs one in a tip.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[str, float]] = {}
+        self.lengths: dict[str, float] = {}
+        self.terms: dict[str, list[str]] = {}
+        self.total_length = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def build(self, venues: dict[str, dict]):
+        for venue_id, venue in venues.items():
+            self.add(venue_id, venue)
+
+    @staticmethod
+    def document_terms(venue: dict) -> Counter:
+        """
+        The field-weighted term frequencies of a raw venue
+        """
+        terms = Counter()
+        for field, text in venue_texts(venue):
+            for token in tokenize(text):
+                terms[token] += FIELD_WEIGHTS[field]
+        return terms
+
+    def add(self, venue_id: str, venue: dict):
+        terms = self.document_terms(venue)
+
+        with self._lock:
+            self._discard(venue_id)
+            if not terms:
+                return
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[venue_id] = tf
+            self.terms[venue_id] = list(terms)
+            self.lengths[venue_id] = sum(terms.values())
+            self.total_length += self.lengths[venue_id]
+
+    def remove(self, venue_id: str):
+        with self._lock:
+            self._discard(venue_id)
+
+    def _discard(self, venue_id: str):
+        length = self.lengths.pop(venue_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.terms.pop(venue_id):
+            del self.postings[term][venue_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def scores(self, query: str) -> dict[str, float]:
+        """
+        BM25 score of every venue matching at least one query term
+        """
+        terms = set(tokenize(query))
+        scores: dict[str, float] = {}
+        with self._lock:
+            n = len(self.lengths)
+            if not n:
+                return scores
+            average = self.total_length / n
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for venue_id, tf in docs.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[venue_id] / average)
+                    scores[venue_id] = scores.get(venue_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    def ranked(self, query: str) -> list[str]:
+        """
+        Ids of the venues matching `query`, best first (ties by id)
+        """
+        scores = self.scores(query)
+        return sorted(scores, key=lambda venue_id: (-scores[venue_id], venue_id))
+
+    @staticmethod
+    def snippets(venue: dict, query: str, n: int = 2, width: int = 160) -> list[str]:
+        """
+        Up to `n` phrases, tips or lists of the venue that mention a query term
+        """
+        terms = set(tokenize(query))
+        found = []
+        for field, text in venue_texts(venue):
+            if field in ("name", "category"):
+                continue
+            if terms & set(tokenize(text)):
+                found.append(text if len(text) <= width else text[:width - 1] + "…")
+                if len(found) == n:
+                    break
+        return found
@@ -0,0 +1,596 @@
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from collections.abc import Mapping, Sequence
+from types import MappingProxyType
+from typing import Callable, Iterable, Iterator
+from cachetools import LRUCache
+from rich import print
+from src.cache import FrozenDict, GEOCache, Snapshot, VenueReader, freeze
+from src.columnar import CATEGORY_BITS, PRICE_CODES, VenueColumns, np
+from src.enums import Categories, PriceTier
+from src.records import VenueRecord
+from src.geo import haversine
+from src.search import SearchIndex, tokenize
+from src.venue_index import VenueIndex
+
+MAGIC = b"RAYASNAP"
+FORMAT = 2
+# magic, format, directory length, offset of the first section
+HEADER = struct.Struct("<8sIIQ")
+ALIGN = 64
+_MISSING = object()
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+
+def _strings(values: list[bytes]):
+    return np.array(values, dtype=f"S{max(1, max(map(len, values), default=1))}")
+
+
+def write_snapshot(path: str, meta: dict, sections: dict):
+    """
+    Write `sections` (numpy arrays, or lists of byte strings stored back to back)
+    to a new file and move it over `path` in one rename. Readers that mapped the
+    previous file keep reading it; the next `open` sees the new one.
+
+    The file is the header, a JSON directory (`meta` plus each section's offset,
+    dtype and length) and the sections, each aligned for `np.frombuffer`.
+    """
+    directory, offset = {}, 0
+    for name, section in sections.items():
+        if isinstance(section, list):
+            directory[name] = [offset, "|u1", sum(map(len, section))]
+            offset = _aligned(offset + directory[name][2])
+        else:
+            directory[name] = [offset, section.dtype.str, len(section)]
+            offset = _aligned(offset + section.nbytes)
+    head = json.dumps({**meta, "sections": directory}).encode()
+    start = _aligned(HEADER.size + len(head))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT, len(head), start))
+        f.write(head)
+        for name, section in sections.items():
+            f.seek(start + directory[name][0])
+            if isinstance(section, list):
+                f.writelines(section)
+            else:
+                f.write(np.ascontiguousarray(section).tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+
+
+def snapshot_meta(path: str) -> dict|None:
+    """
+    The JSON directory of the snapshot file at `path`, or None if there is no readable one
+    """
+    try:
+        with open(path, 'rb') as f:
+            magic, format, head_length, _ = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or format != FORMAT:
+                return None
+            return json.loads(f.read(head_length))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+class SnapshotPublisher:
+    """
+    Publishes the generations of a GEOCache to a snapshot file for serving
+    processes (`SharedCache`), from a background thread, at most every `interval`
+    seconds.
+
+    Row `idx - 1` of the file holds the venue with that idx: the span of its raw
+    JSON and of its packed `VenueRecord` in the blob file, the `VenueColumns`
+    fields, and its BM25 postings in a term-sorted CSR layout. Blobs are only
+    appended, when a generation replaced the venue, so a publish writes the
+    changed venues' JSON and the fixed-size sections rather than every venue.
+    Once superseded blobs outweigh the live ones (and `compact_bytes`), the live
+    ones are copied to a new blob file. Everything is read from one immutable
+    generation, so publishing never holds off the crawler's writes.
+    """
+    def __init__(self, cache: GEOCache, path: str, interval: float = 2, compact_bytes: int = 1 << 20):
+        if np is None:
+            raise RuntimeError("Publishing venue snapshots needs numpy")
+        self.cache = cache
+        self.path = path
+        self.interval = interval
+        self.compact_bytes = compact_bytes
+        self.published: int|None = None
+        # venue id -> its record, blob spans, column values and terms
+        self.encoded: dict[str, dict] = {}
+        self._blobs = None
+        self._blobs_name: str|None = None
+        self._live = self._dead = 0
+        # the blob file of the previous snapshot, which readers may still be opening
+        self._previous = (snapshot_meta(path) or {}).get("blobs")
+
+    def start(self):
+        def publish():
+            while True:
+                if self.cache.version != self.published:
+                    try:
+                        self.write()
+                    except Exception as e:
+                        print(f"[red]Could not publish {self.path}: {e}[/red]")
+                time.sleep(self.interval)
+
+        thread = threading.Thread(target=publish, daemon=True)
+        thread.start()
+
+    def _open_blobs(self):
+        # a new name every time: a file a reader has mapped must never be truncated
+        self._blobs_name = f"{os.path.basename(self.path)}.{uuid.uuid4().hex}.blobs"
+        self._blobs = open(os.path.join(os.path.dirname(self.path), self._blobs_name), 'xb+')
+        self._live = self._dead = 0
+
+    def _append(self, data: bytes) -> tuple[int, int]:
+        if not data:
+            return 0, 0
+        begin = self._blobs.tell()
+        self._blobs.write(data)
+        self._live += len(data)
+        return begin, begin + len(data)
+
+    def _release(self, entry: dict):
+        for begin, end in (entry["venue"], entry["packed"]):
+            self._live -= end - begin
+            self._dead += end - begin
+
+    def _encode(self, venue_id: str, record: VenueRecord|None) -> dict|None:
+        entry = self.encoded.get(venue_id)
+        if entry is not None and entry["record"] is record:
+            return entry
+        if entry is not None:
+            self._release(entry)
+            del self.encoded[venue_id]
+        if record is None:
+            return None
+
+        venue = self.cache.raw(venue_id)
+        raw = json.dumps(venue, ensure_ascii=False).encode() if venue is not None else b""
+        entry = self.encoded[venue_id] = {
+            "record": record,
+            "venue": self._append(raw),
+            "packed": self._append(json.dumps(record.pack(), ensure_ascii=False).encode()),
+            "columns": VenueColumns.row_values(record) if record.indexable else None,
+            "terms": SearchIndex.document_terms(venue) if venue is not None else {},
+        }
+        return entry
+
+    def _compact(self):
+        """
+        Copy the live blobs to a new blob file; readers of the old one keep it mapped
+        """
+        old = self._blobs
+        self._open_blobs()
+        for entry in self.encoded.values():
+            for field in ("venue", "packed"):
+                begin, end = entry[field]
+                old.seek(begin)
+                entry[field] = self._append(old.read(end - begin))
+        old.close()
+
+    def write(self):
+        snapshot = self.cache.snapshot
+        if self._blobs is None:
+            self._open_blobs()
+
+        ids = snapshot.ids
+        rows = len(ids)
+        row_of = {venue_id: row for row, venue_id in enumerate(ids)}
+        for venue_id in [venue_id for venue_id in self.encoded if venue_id not in row_of]:
+            self._release(self.encoded.pop(venue_id))
+        entries = [self._encode(venue_id, snapshot.venues.get(venue_id)) for venue_id in ids]
+        if self._dead > max(self._live, self.compact_bytes):
+            self._compact()
+        self._blobs.flush()
+
+        id_array = _strings([venue_id.encode() for venue_id in ids])
+        sections = {
+            "ids": id_array,
+            "id_order": np.argsort(id_array, kind="stable"),
+            "venue_spans": np.array([entry["venue"] if entry else (0, 0) for entry in entries], dtype=np.uint64).reshape(-1),
+            "record_spans": np.array([entry["packed"] if entry else (0, 0) for entry in entries], dtype=np.uint64).reshape(-1),
+        }
+
+        indexed = [(row, entry["columns"]) for row, entry in enumerate(entries) if entry and entry["columns"]]
+        target = np.array([row for row, _ in indexed], dtype=np.int64)
+        values = list(zip(*(columns for _, columns in indexed))) or [()] * len(VenueColumns.COLUMNS)
+        for (name, dtype), column_values in zip(VenueColumns.COLUMNS.items(), values):
+            column = np.zeros(rows, dtype=dtype)
+            column[target] = np.array(column_values, dtype=dtype)
+            sections[f"columns.{name}"] = column
+
+        postings: dict[str, list[tuple[int, float]]] = {}
+        doc_lengths = np.zeros(rows, dtype=np.float64)
+        for row, entry in enumerate(entries):
+            if entry and entry["terms"]:
+                for term, tf in entry["terms"].items():
+                    postings.setdefault(term, []).append((row, tf))
+                doc_lengths[row] = sum(entry["terms"].values())
+        # postings sorted by the terms' UTF-8 bytes, the order numpy compares them in
+        terms = sorted(postings, key=str.encode)
+        docs = [postings[term] for term in terms]
+        sections["terms"] = _strings([term.encode() for term in terms])
+        sections["term_offsets"] = np.cumsum([0] + [len(d) for d in docs], dtype=np.uint64)
+        sections["posting_rows"] = np.array([row for d in docs for row, _ in d], dtype=np.int64)
+        sections["posting_tf"] = np.array([tf for d in docs for _, tf in d], dtype=np.float64)
+        sections["doc_lengths"] = doc_lengths
+
+        meta = {"version": snapshot.version, "rows": rows, "documents": int(np.count_nonzero(doc_lengths)),
+                "total_length": float(doc_lengths.sum()), "blobs": self._blobs_name, "blobs_size": self._blobs.tell()}
+        write_snapshot(self.path, meta, sections)
+        self.published = snapshot.version
+        self._remove_stale_blobs()
+
+    def _remove_stale_blobs(self):
+        """
+        Delete the blob files neither the new nor the previous snapshot uses.
+        Readers that mapped one keep it until they unmap it.
+        """
+        keep = {self._blobs_name, self._previous}
+        directory = os.path.dirname(self.path)
+        prefix = os.path.basename(self.path) + "."
+        for name in os.listdir(directory or "."):
+            if name.startswith(prefix) and name.endswith(".blobs") and name not in keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        self._previous = self._blobs_name
+
+
+class MappedIds(Sequence):
+    """
+    Venue ids by row, decoded from the mapped file on access
+    """
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, row: int) -> str:
+        return self.array[row].decode()
+
+
+class MappedFile:
+    """
+    The arrays of one mapped snapshot file and the blob file holding its raw
+    venues and records, shared by the snapshot and its views. Nothing here refers back to the snapshot, so a generation is
+    unmapped as soon as the last request holding it is done, without waiting for
+    a GC pass. The last `decoded` raw venues and records read are kept decoded.
+    """
+    def __init__(self, path: str, decoded: int = 256):
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format, head_length, self.start = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or format != FORMAT:
+            raise ValueError(f"{path} is not a venue snapshot (format {FORMAT})")
+        self.meta = json.loads(self.mm[HEADER.size:HEADER.size + head_length])
+        self.blobs = b""
+        if self.meta["blobs_size"]:
+            with open(os.path.join(os.path.dirname(path), self.meta["blobs"]), 'rb') as f:
+                self.blobs = mmap.mmap(f.fileno(), self.meta["blobs_size"], access=mmap.ACCESS_READ)
+
+        self._ids = self.array("ids")
+        self._id_order = self.array("id_order")
+        self.ids = MappedIds(self._ids)
+        self._raws = LRUCache(maxsize=decoded)
+        self._records = LRUCache(maxsize=decoded)
+        self._decode_lock = threading.Lock()
+
+    def array(self, name: str):
+        offset, dtype, count = self.meta["sections"][name]
+        return np.frombuffer(self.mm, dtype=np.dtype(dtype), count=count, offset=self.start + offset)
+
+    def blob(self, name: str, row: int) -> bytes|None:
+        spans = self.array(name[:-1] + "_spans")
+        begin, end = int(spans[2 * row]), int(spans[2 * row + 1])
+        if begin == end:
+            return None
+        return self.blobs[begin:end]
+
+    def row_of(self, venue_id: str) -> int|None:
+        if not venue_id or not isinstance(venue_id, str):
+            return None
+        key = venue_id.encode()
+        if len(key) > self._ids.itemsize:
+            return None
+        i = int(np.searchsorted(self._ids, key, sorter=self._id_order))
+        if i < len(self._ids) and self._ids[self._id_order[i]] == key:
+            return int(self._id_order[i])
+        return None
+
+    def _decoded(self, decoded: LRUCache, row: int, decode: Callable):
+        with self._decode_lock:
+            value = decoded.get(row, _MISSING)
+        if value is _MISSING:
+            value = decode(row)
+            with self._decode_lock:
+                decoded[row] = value
+        return value
+
+    def raw(self, row: int|None) -> FrozenDict|None:
+        if row is None:
+            return None
+        return self._decoded(self._raws, row, self._raw)
+
+    def record(self, row: int) -> VenueRecord:
+        return self._decoded(self._records, row, self._record)
+
+    def _raw(self, row: int) -> FrozenDict|None:
+        data = self.blob("venues", row)
+        return freeze(json.loads(data)) if data else None
+
+    def _record(self, row: int) -> VenueRecord:
+        return VenueRecord.unpack(json.loads(self.blob("records", row)))
+
+
+class MappedVenues(Mapping):
+    """
+    Venue records by Foursquare id, each decoded from the mapped file when it is read
+    """
+    def __init__(self, file: MappedFile):
+        self.file = file
+        spans = file.array("record_spans")
+        self.rows = np.flatnonzero(spans[1::2] > spans[::2])
+
+    def __getitem__(self, venue_id: str) -> VenueRecord:
+        row = self.file.row_of(venue_id)
+        if row is None or self.file.blob("records", row) is None:
+            raise KeyError(venue_id)
+        return self.file.record(row)
+
+    def __contains__(self, venue_id) -> bool:
+        row = self.file.row_of(venue_id)
+        return row is not None and self.file.blob("records", row) is not None
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self.file.ids[row]
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class MappedSnapshot(Snapshot):
+    """
+    One published generation, memory-mapped read-only. Arrays are `np.frombuffer`
+    views of the mapping and venues are decoded one at a time, so opening a
+    snapshot costs the same for ten venues or a million, and every process
+    mapping the file shares its pages.
+    """
+    __slots__ = ("file", "index", "search_index")
+
+    def __init__(self, path: str, version: int, decoded: int = 256):
+        self.file = MappedFile(path, decoded)
+        super().__init__(MappedVenues(self.file), self.file.ids, version)
+        self.index = MappedIndex(self.file)
+        self.search_index = MappedSearchIndex(self.file)
+
+    @property
+    def stat(self) -> os.stat_result:
+        return self.file.stat
+
+    def row_of(self, venue_id: str) -> int|None:
+        return self.file.row_of(venue_id)
+
+    def raw(self, row: int|None) -> FrozenDict|None:
+        return self.file.raw(row)
+
+    def record(self, row: int) -> VenueRecord:
+        return self.file.record(row)
+
+    def id_of(self, idx: int) -> str|None:
+        return super().id_of(idx) or None
+
+
+class MappedIndex:
+    """
+    VenueIndex queries (`top`, `select`) over the columns of a mapped snapshot.
+    Queries run vectorized on the shared arrays; only the returned records are
+    decoded.
+    """
+    def __init__(self, file: MappedFile, default_radius_km: float = 10, distance_scale_km: float = 2):
+        self.file = file
+        self.default_radius_km = default_radius_km
+        self.distance_scale_km = distance_scale_km
+        arrays = {name: file.array(f"columns.{name}") for name in VenueColumns.COLUMNS}
+        self.columns = VenueColumns.view(arrays, range(file.meta["rows"]))
+
+    def __len__(self):
+        return int(np.count_nonzero(self.columns.valid))
+
+    def top(self, n: int = 5, category: Categories = Categories.ALL, price_tier: PriceTier = PriceTier.ALL,
+            location: tuple[float, float] = None, radius_km: float = None, ranking: str = "score") -> list[dict]:
+        """
+        Same as `VenueIndex.top`
+        """
+        if ranking not in VenueIndex.RANKINGS:
+            raise ValueError(f"Unknown ranking: {ranking}")
+        if n < 1:
+            return []
+        if location is None:
+            ranking = "score"
+        else:
+            radius_km = radius_km or self.default_radius_km
+        found = self.columns.top(n, category, price_tier, location, radius_km, ranking, self.distance_scale_km)
+        return [self.export(row, distance) for distance, row in found]
+
+    def select(self, ranked_ids: Iterable[str], n: int = 5, category: Categories = Categories.ALL, price_tier: PriceTier = PriceTier.ALL,
+               location: tuple[float, float] = None, radius_km: float = None) -> list[dict]:
+        """
+        Same as `VenueIndex.select`
+        """
+        columns, found = self.columns, []
+        if n < 1:
+            return found
+        for venue_id in ranked_ids:
+            row = self.file.row_of(venue_id)
+            if row is None or not self._matches(row, category, price_tier):
+                continue
+            distance = None
+            if location is not None:
+                distance = haversine(*location, float(columns.lat[row]), float(columns.lng[row]))
+                if distance > (radius_km or self.default_radius_km):
+                    continue
+            found.append((distance, row))
+            if len(found) == n:
+                break
+        return [self.export(row, distance) for distance, row in found]
+
+    def _matches(self, row: int, category: Categories, price_tier: PriceTier) -> bool:
+        columns = self.columns
+        if not columns.valid[row]:
+            return False
+        if category != Categories.ALL and not columns.categories[row] & CATEGORY_BITS[category]:
+            return False
+        if price_tier != PriceTier.ALL and columns.price[row] != PRICE_CODES[price_tier]:
+            return False
+        return True
+
+    def export(self, row: int, distance: float = None) -> dict:
+        venue = self.file.record(row).export()
+        if distance is not None:
+            venue['distance'] = round(distance, 2)
+        return venue
+
+
+class MappedSearchIndex:
+    """
+    `SearchIndex.scores` over the postings of a mapped snapshot
+    """
+    def __init__(self, file: MappedFile, k1: float = 1.2, b: float = 0.75):
+        self.file = file
+        self.k1 = k1
+        self.b = b
+        self.terms = file.array("terms")
+        self.offsets = file.array("term_offsets")
+        self.rows = file.array("posting_rows")
+        self.tf = file.array("posting_tf")
+        self.lengths = file.array("doc_lengths")
+
+    def __len__(self):
+        return self.file.meta["documents"]
+
+    def _scores(self, query: str) -> tuple:
+        """
+        Rows matching `query` and their BM25 scores, as arrays
+        """
+        n = len(self)
+        if not n:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        average = self.file.meta["total_length"] / n
+        rows, contributions = [], []
+        for term in set(tokenize(query)):
+            key = term.encode()
+            if len(key) > self.terms.itemsize:
+                continue
+            i = int(np.searchsorted(self.terms, key))
+            if i == len(self.terms) or self.terms[i] != key:
+                continue
+            begin, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            docs, tf = self.rows[begin:end], self.tf[begin:end]
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[docs] / average)
+            rows.append(docs)
+            contributions.append(idf * tf * (self.k1 + 1) / norm)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        matched, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        return matched, np.bincount(inverse, weights=np.concatenate(contributions))
+
+    def scores(self, query: str) -> dict[str, float]:
+        ids = self.file.ids
+        return {ids[row]: float(score) for row, score in zip(*self._scores(query))}
+
+    def ranked(self, query: str) -> Iterator[str]:
+        """
+        Same order as `SearchIndex.ranked`, sorted vectorized and decoded lazily,
+        since callers usually stop after a few
+        """
+        rows, scores = self._scores(query)
+        ids = self.file.ids
+        for row in rows[np.lexsort((ids.array[rows], -scores))]:
+            yield ids[row]
+
+
+class SharedCache(VenueReader):
+    """
+    Read-only venue store of a serving process, over the snapshot file that a
+    writer process (RAYA_ROLE=writer) publishes with `SnapshotPublisher`.
+
+    The file is memory-mapped, so every worker on the machine shares one copy of
+    the venues and the indexes. At most every `check_interval` seconds the path
+    is stat'ed; a newly published file is mapped and swapped in with one
+    assignment, while requests still holding the previous generation keep reading
+    it. Until the first snapshot is published the store is empty.
+    """
+    def __init__(self, path: str, check_interval: float = 1):
+        if np is None:
+            raise RuntimeError("Reading venue snapshots needs numpy")
+        self.path = path
+        self.check_interval = check_interval
+        self.loads = 0
+        self._current = (Snapshot(MappingProxyType({}), (), 0), VenueIndex(), SearchIndex())
+        self._checked = -math.inf
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> tuple:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._current
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return self._current
+            self._checked = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return self._current
+
+            snapshot = self._current[0]
+            if isinstance(snapshot, MappedSnapshot) and (stat.st_ino, stat.st_mtime_ns) == (snapshot.stat.st_ino, snapshot.stat.st_mtime_ns):
+                return self._current
+            try:
+                snapshot = MappedSnapshot(self.path, self.loads + 1)
+            except (OSError, ValueError) as e:
+                print(f"Could not map {self.path}: {e}")
+                return self._current
+            self.loads += 1
+            self._current = (snapshot, snapshot.index, snapshot.search_index)
+        return self._current
+
+    def current(self) -> tuple:
+        return self._refresh()
+
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._refresh()[0]
+
+    def raw(self, venue_id: str|None, snapshot: Snapshot = None) -> FrozenDict|None:
+        snapshot = snapshot or self.snapshot
+        if not isinstance(snapshot, MappedSnapshot):
+            return None
+        return snapshot.raw(snapshot.row_of(venue_id))
+
+    @property
+    def index(self) -> MappedIndex|VenueIndex:
+        return self._refresh()[1]
+
+    @property
+    def search_index(self) -> MappedSearchIndex|SearchIndex:
+        return self._refresh()[2]
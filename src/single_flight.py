@@ -0,0 +1,58 @@
+import threading
+from concurrent.futures import Future
+from functools import wraps
+from typing import Any, Callable, Hashable
+from cachetools.keys import hashkey
+from src import metrics
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one: the first caller runs
+    the function, callers arriving while it is in flight wait for its result (or
+    its exception) instead of making the same call again. Nothing is kept once
+    the call returns, so this sits in front of a cache rather than replacing one.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: dict[Hashable, Future] = {}
+        self.lock = threading.Lock()
+        self.collapsed = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> tuple[Any, bool]:
+        """
+        `fn(*args, **kwargs)`, or the result of the call already in flight for
+        `key`, along with whether it was the latter
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+            else:
+                self.collapsed += 1
+        if not leader:
+            # wait outside the lock, so calls for other keys are not held up
+            metrics.single_flight_collapsed.inc(call=self.name)
+            return future.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def __call__(self, fn: Callable) -> Callable:
+        """
+        Decorator collapsing concurrent calls with equal arguments
+        """
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.do(hashkey(*args, **kwargs), fn, *args, **kwargs)[0]
+        return wrapper
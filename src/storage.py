@@ -0,0 +1,222 @@
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterator
+
+
+class StorageBackend(ABC):
+    """
+    Where a `Cache` persists its entries.
+
+    Values reach the backend already JSON-encoded; `flush` receives the changed
+    keys (None marks a deletion) and, when `wants_snapshot` asked for one, the
+    whole cache encoded as a single JSON object. Lazy backends don't load
+    everything up front and serve entries through `get` and `items` instead.
+    """
+    lazy = False
+
+    def load(self) -> dict:
+        return {}
+
+    def get(self, key: str):
+        return None
+
+    def keys(self) -> set:
+        return set()
+
+    def items(self) -> Iterator[tuple[str, object]]:
+        return iter(self.load().items())
+
+    def wants_snapshot(self, changes: int) -> bool:
+        return False
+
+    @abstractmethod
+    def flush(self, changes: dict[str, str|None], snapshot: str|None = None):
+        ...
+
+
+class JsonBackend(StorageBackend):
+    """
+    JSON snapshot plus an append-only journal of changed keys under `.cache/`.
+
+    Once the journal holds `compact_every` entries it is folded into a new
+    snapshot. Loading replays the journal on top of the snapshot.
+    """
+    def __init__(self, filename: str, compact_every: int = 1000):
+        self.filename = filename
+        self.compact_every = compact_every
+        self._journal_entries = 0
+
+    @property
+    def path(self) -> str:
+        return f'.cache/{self.filename}'
+
+    @property
+    def journal_path(self) -> str:
+        return f'.cache/{self.filename}.journal'
+
+    def _read_snapshot(self) -> dict|None:
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    def _read_journal(self) -> list[dict]:
+        """
+        The journal entries up to the first torn one. A torn tail (a crash
+        mid-append) is cut off, so the next append starts on a line of its own.
+        """
+        entries = []
+        if not os.path.exists(self.journal_path):
+            return entries
+        good = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("unterminated line")
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+                good += len(line)
+            torn = f.seek(0, os.SEEK_END) > good
+        if torn:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good)
+        return entries
+
+    def load(self) -> dict:
+        data = self._read_snapshot() or {}
+        journal = self._read_journal()
+        for entry in journal:
+            if entry.get("d"):
+                data.pop(entry["k"], None)
+            else:
+                data[entry["k"]] = entry["v"]
+        self._journal_entries = len(journal)
+        return data
+
+    def wants_snapshot(self, changes: int) -> bool:
+        return self._journal_entries + changes >= self.compact_every
+
+    def flush(self, changes: dict[str, str|None], snapshot: str|None = None):
+        os.makedirs(".cache", exist_ok=True)
+
+        if snapshot is not None:
+            temp_file = f'{self.path}.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+            os.replace(temp_file, self.path)
+            open(self.journal_path, 'w').close()
+            self._journal_entries = 0
+            return
+
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for key, value in changes.items():
+                key = json.dumps(key, ensure_ascii=False)
+                f.write(f'{{"k": {key}, "d": 1}}\n' if value is None else f'{{"k": {key}, "v": {value}}}\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_entries += len(changes)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    One row per entry in a SQLite table, loaded on demand.
+
+    Besides the JSON payload each row carries indexed idx, lat, lng, category
+    (the primary one), price and rating columns extracted from venue-shaped
+    values (NULL otherwise), so the venues can be queried in SQL without
+    decoding the payloads. Tables from before these columns get them added and
+    filled in when opened.
+    """
+    lazy = True
+
+    COLUMNS = {
+        "idx": "INTEGER",
+        "lat": "REAL",
+        "lng": "REAL",
+        "category": "TEXT",
+        "price": "INTEGER",
+        "rating": "REAL",
+    }
+    EXTRACT = {
+        "idx": "$.idx",
+        "lat": "$.location.lat",
+        "lng": "$.location.lng",
+        "category": "$.categories[0].name",
+        "price": "$.price.tier",
+        "rating": "$.rating",
+    }
+
+    def __init__(self, table: str, path: str = '.cache/raya.sqlite3'):
+        self.table = table
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+        columns = "".join(f", {name} {kind}" for name, kind in self.COLUMNS.items())
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, data TEXT NOT NULL{columns})")
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            missing = [name for name in self.COLUMNS if name not in existing]
+            for name in missing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {self.COLUMNS[name]}")
+            if missing:
+                assignments = ", ".join(f"{name} = json_extract(data, '{self.EXTRACT[name]}')" for name in missing)
+                self.conn.execute(f"UPDATE {table} SET {assignments}")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_latlng ON {table} (lat, lng)")
+            for name in ("idx", "category", "price", "rating"):
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{name} ON {table} ({name})")
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.conn.execute(f"SELECT data FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def keys(self) -> set:
+        with self.lock:
+            return {row[0] for row in self.conn.execute(f"SELECT key FROM {self.table}")}
+
+    def items(self) -> Iterator[tuple[str, object]]:
+        with self.lock:
+            rows = self.conn.execute(f"SELECT key, data FROM {self.table}").fetchall()
+        for key, data in rows:
+            yield key, json.loads(data)
+
+    def flush(self, changes: dict[str, str|None], snapshot: str|None = None):
+        columns = ", ".join(self.COLUMNS)
+        extract = ", ".join(f"json_extract(?2, '{path}')" for path in self.EXTRACT.values())
+        upsert = f"INSERT OR REPLACE INTO {self.table} (key, data, {columns}) VALUES (?1, ?2, {extract})"
+
+        with self.lock, self.conn:
+            self.conn.executemany(upsert, [(k, v) for k, v in changes.items() if v is not None])
+            self.conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(k,) for k, v in changes.items() if v is None])
+
+    def import_from(self, backend: StorageBackend):
+        """
+        Copy every entry of another backend into this table
+        """
+        self.flush({k: json.dumps(v, ensure_ascii=False) for k, v in backend.items()})
+
+
+def make_backend(kind: str, filename: str) -> StorageBackend:
+    """
+    Build the storage backend for a cache file. A new SQLite table is seeded
+    from the JSON snapshot and journal of the same name, if there is one.
+    """
+    if kind == "json":
+        return JsonBackend(filename)
+    if kind == "sqlite":
+        backend = SQLiteBackend(filename.removesuffix('.json'))
+        if not len(backend):
+            backend.import_from(JsonBackend(filename))
+        return backend
+    raise ValueError(f"Unknown cache backend: {kind}")
@@ -1,17 +1,19 @@
-import requests
 from rich import print
-from time import sleep
-from concurrent.futures import ThreadPoolExecutor
-from cachetools import cached, LRUCache
-from src.cache import cache
+from threading import Lock
+from time import sleep, time
+from cachetools import cached, TTLCache
+from src.cache import GEOCache, cache
+from src.crawler import Crawler, FetchError
+from src.refresh import RefreshScheduler
+from src.tiling import AdaptiveTiler
+from src.metrics import registry, cache_info_stats
+from src.single_flight import SingleFlight
 
 
 client_id = "<client_id>"
 client_secret = "<client_secret>"
 oauth_token = "<oauth_token>"
 
-headers = {"accept": "application/json"}
-
 RIYADH = [
     (24.980807,46.537516),
     (24.894888,46.639137),
@@ -23,54 +25,60 @@ RIYADH = [
     (24.576487,46.771912)
 ]
 
-n = 0
-@cached(cache=LRUCache(maxsize=1000))
-def get_trending_venues(lat: float, lng: float, client_id: str, client_secret: str) -> dict:
-    url = "https://api.foursquare.com/v2/venues/trending"
-    
+# south, west, north, east
+RIYADH_BBOX = (24.45, 46.45, 25.05, 46.95)
+
+crawler = Crawler()
+scheduler = RefreshScheduler()
+
+
+# memoized for less than a worker cycle, so every cycle sees fresh trending data;
+# failed requests raise FetchError and are not memoized
+@cached(cache=TTLCache(maxsize=1000, ttl=60*10), lock=Lock(), info=True)
+def get_trending_venues(lat: float, lng: float, client_id: str, client_secret: str, radius: int = 10000, limit: int = 30) -> dict:
     params = {
         "v": "20250101",
         "ll": f"{lat},{lng}",
         "client_id": client_id,
         "client_secret": client_secret,
-        "radius": 10000,  # 10km radius
-        "limit": 30
+        "radius": radius,  # meters
+        "limit": limit
     }
-    
-    headers = {"accept": "application/json"}
-    
-    try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        print(f"[red]Error fetching data for coordinates ({lat}, {lng}): {str(e)}[/red]")
-        return None
 
+    result = crawler.get("/venues/trending", params)
+    if result is None:
+        raise FetchError(f"trending venues near ({lat}, {lng})")
+    return result
 
-@cached(cache=LRUCache(maxsize=1000))
+
+# crawler threads share the memo; misses for a venue already being fetched wait for that fetch
+@cached(cache=TTLCache(maxsize=1000, ttl=60*5), lock=Lock(), info=True)
+@SingleFlight("venue_details")
 def get_venue_details(venue_id: str) -> dict:
     print(f"Fetching venue[{venue_id[:5]}] details ")
-    url = f"https://api.foursquare.com/v2/venues/{venue_id}/?oauth_token={oauth_token}"
-    
     params = {
         "v": "20250101",
+        "oauth_token": oauth_token,
     }
-    
-    headers = {"accept": "application/json"}
 
-    response = requests.get(url, params=params, headers=headers)
-    return response.json()
+    result = crawler.get(f"/venues/{venue_id}", params)
+    if result is None:
+        raise FetchError(f"venue {venue_id} details")
+    return result
+
+
+registry.register_cache("trending_venues", cache_info_stats(get_trending_venues))
+registry.register_cache("venue_details", cache_info_stats(get_venue_details))
 
 
 def get_all_venues(points: list[tuple[float, float]]):
-    all_venues = dict()
-    for point in points:
+    def fetch(point: tuple[float, float]):
         lat, lng = point
         print(f"Fetching trending venues near ({lat}, {lng})")
-        
-        result = get_trending_venues(lat, lng, client_id, client_secret)
-        
+        return get_trending_venues(lat, lng, client_id, client_secret)
+
+    all_venues = dict()
+    for result in crawler.map(fetch, points):
         if result and 'response' in result:
             venues = result['response'].get('venues', [])
             for venue in venues:
@@ -78,32 +86,55 @@ def get_all_venues(points: list[tuple[float, float]]):
     return all_venues
 
 
-def con_get_venue_details(venue_id: str):
-    venue = cache.venues.get(venue_id)
-    if venue:
+def get_all_venues_tiled(tiler: AdaptiveTiler):
+    def fetch(query: tuple[float, float, int]):
+        lat, lng, radius = query
+        result = get_trending_venues(lat, lng, client_id, client_secret, radius, tiler.limit)
+        return result.get('response', {}).get('venues', [])
+
+    all_venues = tiler.run(lambda queries: crawler.map(fetch, queries))
+    print(f"Queried {tiler.queried} tiles, {len(tiler.leaves())} tiles in total")
+    return all_venues
+
+
+def con_get_venue_details(venue_id: str, refresh: bool = False):
+    venue = cache.snapshot.venues.get(venue_id)
+    if venue and not refresh and not scheduler.is_stale(venue):
         return venue
     venue = get_venue_details(venue_id).get('response', {}).get("venue", {})
-    
-    idx = cache.get_venue_index(venue_id)
-    venue['idx'] = idx
-    cache.venues[venue_id] = venue
-    return cache.venues[venue_id]
+    if not venue:
+        return None
 
+    # idx is assigned by set_venue
+    return cache.set_venue(venue_id, {**venue, 'fetchedAt': time()})
 
-def worker():
+
+def worker(bbox: tuple[float, float, float, float] = RIYADH_BBOX):
+    """
+    Discover and refresh venues forever. With a bounding box trending venues are
+    discovered by adaptive tiling, otherwise from the fixed RIYADH points.
+    """
+    tiler = AdaptiveTiler(bbox) if bbox else None
     while True:
-        all_venues = get_all_venues(RIYADH)
+        all_venues = get_all_venues_tiled(tiler) if tiler else get_all_venues(RIYADH)
         total_venues = len(set(all_venues.keys()))
         print(f"[green]Total trending venues found: {total_venues}[/green]")
         
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            for venue in all_venues.values():
-                executor.submit(con_get_venue_details, venue['id'])
+        new_venues = [venue_id for venue_id in all_venues if venue_id not in cache.snapshot.venues]
+        with cache.batch():
+            crawler.map(con_get_venue_details, new_venues)
+
+        stale_venues = scheduler.plan(cache.snapshot.venues, cache.index.ranked_ids())
+        print(f"[green]Refreshing {len(stale_venues)} stale venues[/green]")
+        with cache.batch():
+            crawler.map(lambda venue_id: con_get_venue_details(venue_id, refresh=True), stale_venues)
 
         print("[bold][green]Done[/green][/bold]")
         sleep(60*30) # 30 minutes
 
 
 if __name__ == "__main__":
+    if not isinstance(cache, GEOCache):
+        raise SystemExit("The crawler writes venues, run it with RAYA_ROLE=standalone or writer")
     worker()
      
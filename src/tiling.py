@@ -0,0 +1,141 @@
+import math
+from typing import Callable
+from src.cache import Cache
+from src.geo import haversine, KM_PER_DEG_LAT
+
+
+class AdaptiveTiler:
+    """
+    Quadtree tiling of a city bounding box for trending discovery.
+
+    The box starts as a grid of roughly `tile_km` tiles. A tile whose trending
+    response saturates `limit` is split into four children (down to `max_depth`),
+    and children are merged back into their parent once together they yield
+    less than `merge_ratio * limit` for `merge_after` cycles in a row, never in
+    the cycle of the split. Every merge that had to be split again doubles the
+    cycles required, so a tile doesn't keep flapping between the two.
+    Tiles that come back empty are skipped for
+    exponentially more cycles (up to `2 ** max_idle`); tiles whose query failed
+    stay due and are retried next cycle. Tiles and their yields
+    are persisted, so each cycle starts from what the previous ones learned.
+    """
+    def __init__(self, bbox: tuple[float, float, float, float], limit: int = 30, tile_km: float = 20,
+                 max_depth: int = 4, merge_ratio: float = 0.5, merge_after: int = 3, max_idle: int = 3, filename: str = "tiles.json"):
+        self.bbox = bbox  # south, west, north, east
+        self.limit = limit
+        self.tile_km = tile_km
+        self.max_depth = max_depth
+        self.merge_ratio = merge_ratio
+        self.merge_after = merge_after
+        self.max_idle = max_idle
+
+        self.tiles: Cache = Cache(filename)
+        self.tiles.load_from_filesystem()
+        self.cycle = self.tiles.get("_cycle", 0)
+        # queries made by the last cycle, splits included
+        self.queried = 0
+        if not self.leaves():
+            self._seed()
+
+    def _seed(self):
+        south, west, north, east = self.bbox
+        lat_step = self.tile_km / KM_PER_DEG_LAT
+        lng_step = self.tile_km / (KM_PER_DEG_LAT * math.cos(math.radians((south + north) / 2)))
+        rows = max(1, math.ceil((north - south) / lat_step))
+        cols = max(1, math.ceil((east - west) / lng_step))
+        for row in range(rows):
+            for col in range(cols):
+                s, w = south + row * (north - south) / rows, west + col * (east - west) / cols
+                n, e = south + (row + 1) * (north - south) / rows, west + (col + 1) * (east - west) / cols
+                self._put(f"{row}_{col}", [s, w, n, e], leaf=True)
+
+    def _put(self, key: str, bbox: list[float], leaf: bool, **state):
+        tile = {"bbox": bbox, "leaf": leaf, "yield": None, "idle": 0, "due": 0}
+        tile.update(state)
+        self.tiles[key] = tile
+
+    def _update(self, key: str, **state):
+        self.tiles[key] = {**self.tiles[key], **state}
+
+    @staticmethod
+    def query_of(tile: dict) -> tuple[float, float, int]:
+        """
+        Center and radius in meters of the circle covering a tile
+        """
+        s, w, n, e = tile["bbox"]
+        lat, lng = (s + n) / 2, (w + e) / 2
+        return lat, lng, math.ceil(haversine(lat, lng, n, e) * 1000)
+
+    def leaves(self) -> list[str]:
+        return [key for key, tile in self.tiles.items() if not key.startswith("_") and tile["leaf"]]
+
+    def due(self) -> list[str]:
+        return [key for key in self.leaves() if self.tiles[key]["due"] <= self.cycle]
+
+    def _split(self, key: str) -> list[str]:
+        s, w, n, e = self.tiles[key]["bbox"]
+        lat, lng = (s + n) / 2, (w + e) / 2
+        quadrants = [[s, w, lat, lng], [s, lng, lat, e], [lat, w, n, lng], [lat, lng, n, e]]
+        self._update(key, leaf=False, split=self.cycle, low=0)
+        children = []
+        for i, bbox in enumerate(quadrants):
+            self._put(f"{key}/{i}", bbox, leaf=True)
+            children.append(f"{key}/{i}")
+        return children
+
+    def _merge(self):
+        parents = {key.rsplit("/", 1)[0] for key in self.leaves() if "/" in key}
+        for parent in parents:
+            children = [f"{parent}/{i}" for i in range(4)]
+            if not all(self.tiles.get(c, {}).get("leaf") for c in children):
+                continue
+            tile = self.tiles[parent]
+            if tile.get("split") == self.cycle:
+                continue
+            yields = [self.tiles[c]["yield"] for c in children]
+            # consecutive cycles the children together stayed under the threshold
+            low = tile.get("low", 0) + 1 if None not in yields and sum(yields) < self.merge_ratio * self.limit else 0
+            if low < self.merge_after * 2 ** tile.get("merges", 0):
+                if low != tile.get("low", 0):
+                    self._update(parent, low=low)
+                continue
+            for child in children:
+                del self.tiles[child]
+            self._update(parent, leaf=True, idle=0, low=0, merges=tile.get("merges", 0) + 1, due=self.cycle + 1, **{"yield": sum(yields)})
+
+    def run(self, fetch: Callable[[list[tuple[float, float, int]]], list[list[dict]]]) -> dict[str, dict]:
+        """
+        Run one discovery cycle.
+
+        `fetch` takes a batch of (lat, lng, radius_m) queries and returns the venues
+        found for each, or None for a query that failed. Returns all venues found,
+        keyed by id.
+        """
+        self.cycle += 1
+        self.tiles["_cycle"] = self.cycle
+        venues = {}
+        frontier = self.due()
+        self.queried = 0
+        while frontier:
+            self.queried += len(frontier)
+            results = fetch([self.query_of(self.tiles[key]) for key in frontier])
+            next_frontier = []
+            for key, found in zip(frontier, results):
+                if found is None:
+                    continue
+                for venue in found:
+                    venues[venue['id']] = venue
+
+                depth = key.count("/")
+                if len(found) >= self.limit and depth < self.max_depth:
+                    self._update(key, **{"yield": len(found)})
+                    next_frontier.extend(self._split(key))
+                    continue
+
+                idle = min(self.tiles[key]["idle"] + 1, self.max_idle) if not found else 0
+                self._update(key, idle=idle, due=self.cycle + 2 ** idle, **{"yield": len(found)})
+            frontier = next_frontier
+
+        self._merge()
+        self.tiles.save_to_filesystem()
+        return venues
@@ -0,0 +1,82 @@
+import inspect
+import threading
+from enum import Enum
+from functools import wraps
+from typing import Callable
+from cachetools import LRUCache
+
+COMPACT_FIELDS = ("idx", "name", "rating", "price", "categories", "distance")
+
+
+def compact_venue(venue: dict, detail: bool = False) -> dict:
+    """
+    Project a venue onto the few fields the assistant needs to answer. With
+    `detail`, opening hours and the address are kept as well.
+    """
+    compact = {k: venue[k] for k in COMPACT_FIELDS if venue.get(k) is not None}
+    if isinstance(compact.get('price'), dict):
+        compact['price'] = compact['price'].get('message')
+    if compact.get('categories'):
+        compact['categories'] = [c['name'] if isinstance(c, dict) else c for c in compact['categories']]
+
+    if detail:
+        hours = venue.get('hours') or {}
+        if hours:
+            compact['hours'] = {
+                "status": hours.get('status'),
+                "timeframes": {t.get('days'): [o.get('renderedTime') for o in t.get('open', [])] for t in hours.get('timeframes', [])}
+            }
+        location = venue.get('location') or {}
+        # raw venues keep the lines in formattedAddress, cleaned ones in address
+        address = location.get('formattedAddress') or location.get('address')
+        if address:
+            compact['address'] = address if isinstance(address, str) else ", ".join(address)
+    return compact
+
+
+def _normalize(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+class ToolCache:
+    """
+    LRU memo for LLM tool calls, keyed by the tool and its normalized arguments
+    (defaults applied, floats rounded, enums by value). Every entry remembers the
+    data version it was computed at and is recomputed once `version()` moves on.
+    """
+    def __init__(self, version: Callable[[], int], maxsize: int = 512):
+        self.version = version
+        self.entries: LRUCache = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, fn: Callable) -> Callable:
+        signature = inspect.signature(fn)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (fn.__name__, tuple((k, _normalize(v)) for k, v in bound.arguments.items()))
+            version = self.version()
+
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] == version:
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+
+            result = fn(*args, **kwargs)
+            with self.lock:
+                self.entries[key] = (version, result)
+            return result
+
+        return wrapper
@@ -0,0 +1,221 @@
+import heapq
+import threading
+from typing import Callable, Iterable
+from bisect import bisect_left, insort
+from src.enums import Categories, PriceTier
+from src.columnar import VenueColumns, default_score, np
+from src.geo import GeoGrid, haversine
+from src.records import VenueRecord
+
+
+def popularity_score(record: VenueRecord, score_fn: Callable = default_score) -> float:
+    return float(score_fn(record.rating or 0, record.here_now))
+
+
+class IndexView:
+    """
+    One state of a `VenueIndex`, read without locks. A view is never modified
+    once published: `VenueIndex.update` copies what it changes into the next one.
+    """
+    __slots__ = ("records", "scores", "buckets", "grid", "columns")
+
+    def __init__(self, records: dict[str, VenueRecord], scores: dict[str, float],
+                 buckets: dict[tuple[Categories, PriceTier], list[tuple[float, int, str]]], grid: GeoGrid, columns: VenueColumns|None):
+        self.records = records
+        self.scores = scores
+        self.buckets = buckets
+        self.grid = grid
+        self.columns = columns
+
+
+class VenueIndex:
+    """
+    Query-ready view over the venue records.
+
+    Every record is scored once when it is added. Its key
+    is then kept in presorted buckets for each (category, price tier) pair it
+    belongs to, `Categories.ALL` and `PriceTier.ALL` included, so a top-N query
+    is a slice of a single bucket. Venue coordinates are kept in a `GeoGrid`
+    for nearest-venue queries and, when numpy is installed, every venue is also
+    a row in `VenueColumns` so location-scored queries run vectorized.
+
+    Queries read the current `IndexView` without taking a lock; writers build
+    the next view from a batch of changes and swap it in with one assignment.
+
+    `score_fn(rating, here_now)` is the popularity formula; it must accept both
+    scalars and numpy arrays.
+    """
+    RANKINGS = ("score", "distance", "weighted")
+
+    def __init__(self, default_radius_km: float = 10, distance_scale_km: float = 2, score_fn: Callable = default_score):
+        self.default_radius_km = default_radius_km
+        self.distance_scale_km = distance_scale_km
+        self.score_fn = score_fn
+        self.view = IndexView({}, {}, {}, GeoGrid(), VenueColumns(score_fn) if np is not None else None)
+        # venue id -> its bucket key and buckets, for writers only
+        self._keys: dict[str, tuple[tuple[float, int, str], list[tuple[Categories, PriceTier]]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def records(self) -> dict[str, VenueRecord]:
+        return self.view.records
+
+    def __len__(self):
+        return len(self.view.records)
+
+    def build(self, records: dict[str, VenueRecord]):
+        self.update(records)
+
+    def add(self, venue_id: str, record: VenueRecord):
+        """
+        Index (or re-index) a venue. Venues without a position or not in an
+        allowed category are dropped from the index.
+        """
+        self.update({venue_id: record})
+
+    def remove(self, venue_id: str):
+        self.update({venue_id: None})
+
+    def update(self, records: dict[str, VenueRecord|None]):
+        """
+        Index, re-index or (for None) drop several venues and publish the result
+        as one new view. Only the buckets and grid cells that change are copied,
+        besides the records, scores and columns.
+        """
+        scores = {venue_id: popularity_score(record, self.score_fn)
+                  for venue_id, record in records.items() if record is not None and record.indexable}
+
+        with self._lock:
+            view = self.view
+            next_view = IndexView(dict(view.records), dict(view.scores), dict(view.buckets), view.grid.copy(),
+                                  view.columns.copy() if view.columns is not None else None)
+            copied, added = set(), {}
+
+            def bucket(key: tuple[Categories, PriceTier]) -> list:
+                if key not in copied:
+                    next_view.buckets[key] = list(next_view.buckets.get(key, ()))
+                    copied.add(key)
+                return next_view.buckets[key]
+
+            for venue_id, record in records.items():
+                if venue_id in self._keys:
+                    key, buckets = self._keys.pop(venue_id)
+                    for name in buckets:
+                        keys = bucket(name)
+                        i = bisect_left(keys, key)
+                        if i < len(keys) and keys[i] == key:
+                            del keys[i]
+                    next_view.records.pop(venue_id, None)
+                    next_view.scores.pop(venue_id, None)
+                    next_view.grid.remove(venue_id)
+                    if next_view.columns is not None:
+                        next_view.columns.remove(venue_id)
+                if venue_id not in scores:
+                    continue
+
+                key = (-scores[venue_id], record.idx or 0, venue_id)
+                categories = {Categories.ALL, *record.category_enums}
+                tiers = {PriceTier.ALL} | ({record.price_tier} if record.price_tier else set())
+                buckets = [(c, p) for c in categories for p in tiers]
+                for name in buckets:
+                    added.setdefault(name, []).append(key)
+
+                next_view.records[venue_id] = record
+                next_view.scores[venue_id] = scores[venue_id]
+                self._keys[venue_id] = (key, buckets)
+                next_view.grid.add(venue_id, record.lat, record.lng)
+                if next_view.columns is not None:
+                    next_view.columns.set(venue_id, record)
+
+            for name, keys in added.items():
+                if len(keys) == 1:
+                    insort(bucket(name), keys[0])
+                else:
+                    # a sorted run and a few new keys: timsort merges them in about linear time
+                    bucket(name).extend(keys)
+                    bucket(name).sort()
+            self.view = next_view
+
+    def ranked_ids(self) -> list[str]:
+        """
+        Ids of every indexed venue, most popular first
+        """
+        return [venue_id for _, _, venue_id in self.view.buckets.get((Categories.ALL, PriceTier.ALL), [])]
+
+    def top(self, n: int = 5, category: Categories = Categories.ALL, price_tier: PriceTier = PriceTier.ALL,
+            location: tuple[float, float] = None, radius_km: float = None, ranking: str = "score") -> list[dict]:
+        """
+        Top `n` venues for a category and price tier.
+
+        Without a location this is a slice of the presorted bucket. With a location
+        only venues within `radius_km` (default `default_radius_km`) are considered,
+        ranked by popularity ("score"), nearness ("distance") or popularity damped
+        by distance ("weighted"). Results then carry a `distance` in kilometers.
+        """
+        if ranking not in self.RANKINGS:
+            raise ValueError(f"Unknown ranking: {ranking}")
+        if n < 1:
+            return []
+
+        view = self.view
+        if location is None:
+            keys = view.buckets.get((category, price_tier), [])[:n]
+            return [self.export(view.records[venue_id]) for _, _, venue_id in keys]
+
+        lat, lng = location
+        if ranking != "distance" and view.columns is not None:
+            found = view.columns.top(n, category, price_tier, location, radius_km or self.default_radius_km, ranking, self.distance_scale_km)
+        elif ranking == "distance":
+            found = view.grid.nearest(lat, lng, n, lambda venue_id: self._matches(view, venue_id, category, price_tier), radius_km or self.default_radius_km)
+        else:
+            nearby = view.grid.within(lat, lng, radius_km or self.default_radius_km)
+            found = heapq.nlargest(
+                n,
+                ((d, venue_id) for d, venue_id in nearby if self._matches(view, venue_id, category, price_tier)),
+                key=lambda x: (self._ranked_score(view, x[1], x[0], ranking), -(view.records[x[1]].idx or 0))
+            )
+        return [self.export(view.records[venue_id], distance) for distance, venue_id in found]
+
+    def select(self, ranked_ids: Iterable[str], n: int = 5, category: Categories = Categories.ALL, price_tier: PriceTier = PriceTier.ALL,
+               location: tuple[float, float] = None, radius_km: float = None) -> list[dict]:
+        """
+        The first `n` of `ranked_ids` that are indexed and pass the category, price
+        tier and (with a location) radius filters, in the given order
+        """
+        found = []
+        if n < 1:
+            return found
+        view = self.view
+        for venue_id in ranked_ids:
+            if venue_id not in view.records or not self._matches(view, venue_id, category, price_tier):
+                continue
+            record = view.records[venue_id]
+            distance = None
+            if location is not None:
+                distance = haversine(*location, record.lat, record.lng)
+                if distance > (radius_km or self.default_radius_km):
+                    continue
+            found.append((distance, record))
+            if len(found) == n:
+                break
+        return [self.export(r, distance) for distance, r in found]
+
+    @staticmethod
+    def _matches(view: IndexView, venue_id: str, category: Categories, price_tier: PriceTier) -> bool:
+        record = view.records[venue_id]
+        if category != Categories.ALL and category not in record.category_enums:
+            return False
+        if price_tier != PriceTier.ALL and price_tier != record.price_tier:
+            return False
+        return True
+
+    def _ranked_score(self, view: IndexView, venue_id: str, distance: float, ranking: str) -> float:
+        if ranking == "weighted":
+            return view.scores[venue_id] / (1 + distance / self.distance_scale_km)
+        return view.scores[venue_id]
+
+    def export(self, record: VenueRecord, distance: float = None) -> dict:
+        venue = record.export()
+        if distance is not None:
+            venue['distance'] = round(distance, 2)
+        return venue
@@ -0,0 +1,35 @@
+import pytest
+from src.answer_cache import AnswerCache
+
+RIYADH = (24.698889, 46.685151)
+
+
+# rephrasings of each other as far as the embedding goes (cosine 0.92-0.95), asking opposite things
+@pytest.mark.parametrize("cached, asked", [
+    ("recommend a quiet specialty coffee cafe in olaya with outdoor seating",
+     "recommend a quiet specialty coffee cafe in olaya with indoor seating"),
+    ("best restaurant in riyadh with wifi for working", "best restaurant in riyadh without wifi for working"),
+    ("family friendly restaurants in olaya with kids play area", "family friendly restaurants in olaya without kids play area"),
+    ("which cafes near al masmak fortress in riyadh are open late on friday night",
+     "which cafes near al masmak fortress in riyadh are open late on sunday night"),
+])
+def test_opposite_queries_miss(cached, asked):
+    cache = AnswerCache()
+    cache.put(cached, "answer", 1, RIYADH)
+    assert cache.get(asked, 1, RIYADH) is None
+
+
+@pytest.mark.parametrize("asked", ["Best cafes in Olaya?", "best  cafes in olaya", "BEST CAFES IN OLAYA!"])
+def test_same_query_hits(asked):
+    cache = AnswerCache()
+    cache.put("best cafes in olaya", "answer", 1, RIYADH)
+    assert cache.get(asked, 1, RIYADH) == "answer"
+
+
+def test_scoped_by_version_location_and_context():
+    cache = AnswerCache()
+    cache.put("best cafes", "answer", 1, RIYADH, "previous answer")
+    assert cache.get("best cafes", 2, RIYADH, "previous answer") is None
+    assert cache.get("best cafes", 1, (21.54, 39.17), "previous answer") is None
+    assert cache.get("best cafes", 1, RIYADH, "another answer") is None
+    assert cache.get("best cafes", 1, RIYADH, "previous answer") == "answer"
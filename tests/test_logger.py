@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+import pytest
+
+
+class StubBot:
+    def __init__(self, fail=False, block: threading.Event|None = None):
+        self.fail = fail
+        self.block = block
+        self.messages: list[str] = []
+
+    def send_message(self, chat_id, text, parse_mode=None):
+        if self.block is not None:
+            self.block.wait(5)
+        if self.fail:
+            raise ConnectionError("telegram unreachable")
+        self.messages.append(text)
+
+
+@pytest.fixture
+def logger_module(tmp_path, monkeypatch):
+    # importing src.logger creates logs/ in the working directory and installs an excepthook
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "excepthook", sys.excepthook)
+    monkeypatch.delenv("DEBUG_BOT_TOKEN", raising=False)
+    from src import logger
+    return logger
+
+
+def notifier(logger_module, bot, **kwargs):
+    kwargs = {"batch_window": 0.05, "dedup_window": 0.5, "min_interval": 0, **kwargs}
+    return logger_module.Notifier(bot, "chat", **kwargs)
+
+
+def test_messages_are_batched(logger_module):
+    bot = StubBot()
+    n = notifier(logger_module, bot)
+    assert n.send("first") and n.send("second <b>")
+    assert n.flush(5)
+    assert bot.messages == ["<pre>first\n\nsecond &lt;b&gt;</pre>"]
+    assert n.sent == 1
+
+
+def test_repeats_are_coalesced(logger_module):
+    bot = StubBot()
+    n = notifier(logger_module, bot)
+    for i in range(5):
+        n.send(f"Traceback at 0x{i:x}\nValueError: request {i} failed")
+    assert n.flush(5)
+    assert len(bot.messages) == 1 and n.coalesced == 4
+    # the repeat count goes out once the dedup window closes, even with nothing new queued
+    for _ in range(200):
+        if len(bot.messages) > 1:
+            break
+        time.sleep(0.01)
+    assert bot.messages[1] == "<pre>[repeated 4 more times] ValueError: request 0 failed</pre>"
+
+
+def test_full_queue_drops(logger_module):
+    release = threading.Event()
+    bot = StubBot(block=release)
+    n = notifier(logger_module, bot, max_queue=1, batch_window=0)
+    n.send("taken by the sender")
+    # wait until the sender is blocked in send_message and the queue is empty again
+    for _ in range(500):
+        if not n.queue.qsize():
+            break
+        time.sleep(0.01)
+    assert n.send("queued")
+    assert not n.send("dropped")
+    assert n.dropped == 1
+    release.set()
+    assert n.flush(5)
+    assert [m for m in bot.messages if "dropped" in m] == []
+
+
+def test_failing_bot_is_counted(logger_module):
+    n = notifier(logger_module, StubBot(fail=True))
+    n.send("boom")
+    assert n.flush(5)
+    assert n.failed == 1 and n.sent == 0
+
+
+def test_logger_notifies_through_bot(logger_module):
+    bot = StubBot()
+    log = logger_module.Logger("test", bot=bot, set_exception_hook=False)
+    log.notifier = notifier(logger_module, bot)
+    log.info("not sent")
+    log.error("sent")
+    assert log.notifier.flush(5)
+    assert bot.messages == ["<pre>sent</pre>"]